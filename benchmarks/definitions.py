@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Benchmark definition and unit validation of variables and equations."""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+
+from essm import Eq
+from essm.equations import Equation
+from essm.variables import Variable
+from essm.variables._core import VALIDATED_UNITS
+from essm.variables.units import kelvin, meter, second
+
+
+class TimeDefinitions:
+    """Define synthetic variables and equations through the metaclasses.
+
+    Units validated in earlier repeats are cached, except in the uncached
+    variants.
+    """
+
+    params = [10, 100]
+    param_names = ['n']
+
+    def time_variables(self, n):
+        """Define n variables."""
+        with Variable.scope():
+            for i in range(n):
+                type('bench_v{0}'.format(i), (Variable, ), {
+                    'unit': meter / second,
+                    'default': i,
+                })
+
+    def time_equations(self, n):
+        """Define n equations with internal variables."""
+        with Variable.scope(), Equation.scope():
+            for i in range(n):
+                x = type('bench_x{0}'.format(i), (Variable, ),
+                         {'unit': meter})
+                t = type('bench_t{0}'.format(i), (Variable, ),
+                         {'unit': second})
+                v = type('bench_u{0}'.format(i), (Variable, ),
+                         {'unit': meter / second})
+                type('bench_eq{0}'.format(i), (Equation, ),
+                     {'expr': Eq(v, x / t)})
+
+    def time_variables_uncached(self, n):
+        """Define n variables validating all units."""
+        VALIDATED_UNITS.hashes.clear()
+        self.time_variables(n)
+
+    def time_equations_uncached(self, n):
+        """Define n equations validating all units."""
+        VALIDATED_UNITS.hashes.clear()
+        self.time_equations(n)
+
+
+def module_source(prefix, n):
+    """Return source of a module defining a chain of n variables."""
+    lines = [
+        'from essm.variables import Variable',
+        'from essm.variables.units import meter',
+    ]
+    for i in range(n):
+        lines += [
+            '', '', 'class {0}{1}(Variable):'.format(prefix, i),
+            '    """Generated variable."""', '', '    unit = meter',
+        ]
+        if i:
+            lines.append('    expr = 2 * {0}{1}'.format(prefix, i - 1))
+    return '\n'.join(lines) + '\n'
+
+
+class TimeModuleImport:
+    """Import generated modules with many definitions.
+
+    The import time should grow linearly with the number of classes.
+    Units validated in earlier repeats are cached, except in the uncached
+    variant.
+    """
+
+    params = [200, 400, 800]
+    param_names = ['n']
+
+    def setup(self, n):
+        """Write the generated module."""
+        self.path = tempfile.mkdtemp()
+        self.name = 'bench_module_{0}'.format(n)
+        with open(os.path.join(self.path, self.name + '.py'), 'w') as out:
+            out.write(module_source('bench_chain{0}_'.format(n), n))
+        sys.path.insert(0, self.path)
+
+    def teardown(self, n):
+        """Remove the generated module."""
+        sys.path.remove(self.path)
+        sys.modules.pop(self.name, None)
+        shutil.rmtree(self.path)
+
+    def time_import(self, n):
+        """Import the generated module."""
+        with Variable.scope():
+            importlib.import_module(self.name)
+            sys.modules.pop(self.name)
+
+    def time_import_uncached(self, n):
+        """Import the generated module validating all units."""
+        VALIDATED_UNITS.hashes.clear()
+        self.time_import(n)
+
+
+class TimeCheckUnit:
+    """Validate units of deep expressions."""
+
+    params = [5, 20, 50]
+    param_names = ['depth']
+
+    def setup(self, depth):
+        """Build nested expression of the given depth."""
+        with Variable.scope():
+            x = type('bench_T', (Variable, ), {'unit': kelvin})
+            y = type('bench_L', (Variable, ), {'unit': meter})
+            z = type('bench_W', (Variable, ), {'unit': meter})
+        expr = x
+        for i in range(depth):
+            expr = (expr + (i + 1) * x) * y / (y + i * z)
+        self.expr = expr
+
+    def time_check_unit(self, depth):
+        """Check units of the nested expression."""
+        Variable.check_unit(self.expr)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Benchmark numeric evaluation of equations."""
+
+import numpy as np
+from sympy import lambdify
+
+from essm.equations.physics.thermodynamics import eq_Nu_forced_all
+from essm.variables.utils import extract_variables
+
+
+class TimeEvaluation:
+    """Evaluate eq_Nu_forced_all with NumPy."""
+
+    params = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+    param_names = ['points']
+    timeout = 120
+
+    def setup(self, points):
+        """Compile expression and create input arrays."""
+        self.variables = sorted(extract_variables(eq_Nu_forced_all.rhs),
+                                key=str)
+        self.func = lambdify(self.variables, eq_Nu_forced_all.rhs, 'numpy')
+        rng = np.random.RandomState(42)
+        self.values = [
+            rng.uniform(1e2, 1e5, points) for variable in self.variables
+        ]
+
+    def time_lambdify(self, points):
+        """Evaluate expression over all points."""
+        self.func(*self.values)
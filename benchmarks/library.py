@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Benchmark substitution, tables and writers over the libraries."""
+
+import warnings
+
+import essm
+from essm._generator import EquationWriter
+from essm.equations import Equation
+from essm.variables.utils import (_METADATA_ROWS, generate_metadata_table,
+                                  subs_eq)
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore')
+    essm.preload(cache=False)
+
+
+class TimeSubstitution:
+    """Substitute equations into each other as in the documentation."""
+
+    def setup(self):
+        """Import equations and variables."""
+        from essm.equations.leaf.energy_water import (eq_El, eq_Elmol,
+                                                      eq_Hl, eq_Rs_enbal)
+        from essm.variables.leaf.energy_water import T_l
+        from essm.variables.physics.thermodynamics import T_a
+        self.args = (eq_Rs_enbal, [eq_El, eq_Hl], eq_Elmol,
+                     {T_l: 301., T_a: 300.})
+
+    def time_subs_eq(self):
+        """Substitute a chain of equations and values."""
+        subs_eq(*self.args)
+
+    def time_subs_method(self):
+        """Substitute equations using BaseEquation.subs."""
+        self.args[0].subs(*self.args[1] + [self.args[2]])
+
+
+class TimeMetadataTable:
+    """Render table of all registered variables."""
+
+    def time_generate_metadata_table(self):
+        """Generate table over the full registry with cached rows."""
+        generate_metadata_table()
+
+    def time_generate_metadata_table_uncached(self):
+        """Generate table over the full registry rendering all rows."""
+        _METADATA_ROWS.clear()
+        generate_metadata_table()
+
+
+class TimeEquationWriter:
+    """Serialize all registered equations."""
+
+    def setup(self):
+        """Collect equations defined in the libraries."""
+        self.equations = [
+            expr for expr, definition in Equation.__registry__.items()
+            if definition.__module__.startswith('essm.equations.')
+        ]
+
+    def time_equation_writer(self):
+        """Render all equations to source code."""
+        writer = EquationWriter(docstring='Benchmark.')
+        for equation in self.equations:
+            writer.eq(equation)
+        str(writer)
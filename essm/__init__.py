@@ -85,9 +85,16 @@ You can import pre-defined variables and equations as e.g.:
 
     >>> from essm.variables.physics.thermodynamics import *
     >>> from essm.equations.physics.thermodynamics import *
+
+All pre-defined libraries can be imported at once using
+:func:`essm.preload`, which caches validated units between runs and
+returns the import time of each module.
 """
 
 from __future__ import absolute_import
 
 from sympy import E as e
 from sympy import Eq, solve, sqrt
+
+from ._instrument import instrument
+from ._preload import preload
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Persistent caches.
+
+The cache directory defaults to ``~/.cache/essm`` and can be changed
+using the ``ESSM_CACHE_DIR`` environment variable.  It is only
+accessible by its owner, and the keys of cached values include the
+versions of essm and SymPy.
+"""
+
+from __future__ import absolute_import
+
+import ast
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import sympy
+from sympy import Basic, srepr, Symbol
+
+from ._instrument import record_cache
+
+try:
+    from .version import __version__
+except ImportError:  # pragma: no cover
+    __version__ = None
+
+VERSIONS = (__version__, sympy.__version__)
+"""Versions of essm and SymPy that invalidate cached values."""
+
+_SREPR_NODES = tuple(
+    getattr(ast, name) for name in (
+        'Call', 'Constant', 'Expression', 'keyword', 'List', 'Load', 'Name',
+        'NameConstant', 'Num', 'Str', 'Tuple', 'UnaryOp', 'USub'
+    ) if hasattr(ast, name)
+)
+
+
+def cache_dir(*parts):
+    """Return path of a cache directory, creating it if needed."""
+    root = os.environ.get('ESSM_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or
+        os.path.join(os.path.expanduser('~'), '.cache'), 'essm'
+    )
+    path = os.path.join(root, *parts)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path, 0o700)
+        except OSError:
+            # Another process may have created it in the meantime.
+            if not os.path.isdir(path):
+                raise
+    return path
+
+
+def stable_hash(*parts):
+    """Return hash of ``repr(parts)`` that is stable across processes."""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def atomic_write(path, data):
+    """Write bytes to a file without exposing partially written content."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        getattr(os, 'replace', os.rename)(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class HashSet(object):
+    """Set of hashes that can be persisted in the cache directory."""
+
+    def __init__(self, name):
+        """Initialize empty set stored as ``name`` in the cache directory."""
+        self.name = name
+        self.hashes = set()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def path(self):
+        """Return file name of the persisted set for the current versions."""
+        return os.path.join(
+            cache_dir(), '{0}-{1}'.format(self.name, stable_hash(VERSIONS))
+        )
+
+    def __contains__(self, key):
+        """Check membership and count hits and misses."""
+        hit = key in self.hashes
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        record_cache(self.name, hit)
+        return hit
+
+    def __len__(self):
+        """Return number of stored hashes."""
+        return len(self.hashes)
+
+    def add(self, key):
+        """Add hash to the set."""
+        self.hashes.add(key)
+
+    def load(self):
+        """Merge hashes stored in the cache directory."""
+        if os.path.exists(self.path):
+            with open(self.path) as data:
+                self.hashes.update(
+                    line.strip() for line in data if line.strip()
+                )
+
+    def save(self):
+        """Store all hashes in the cache directory."""
+        atomic_write(
+            self.path, '\n'.join(sorted(self.hashes)).encode('utf-8')
+        )
+
+
+class PickleCache(object):
+    """Pickled values stored in a subdirectory of the cache directory.
+
+    Values that cannot be pickled, or unpickled in a later session, are
+    silently recomputed by the caller.
+    """
+
+    def __init__(self, name):
+        """Initialize cache stored as ``name`` in the cache directory."""
+        self.name = name
+
+    def path(self, key):
+        """Return file name of a cached value."""
+        return os.path.join(cache_dir(self.name), stable_hash(key, VERSIONS))
+
+    def get(self, key, default=None):
+        """Return cached value or ``default`` and record a hit or miss."""
+        try:
+            with open(self.path(key), 'rb') as data:
+                value = pickle.load(data)
+        except (AttributeError, EnvironmentError, EOFError, ImportError,
+                KeyError, pickle.UnpicklingError):
+            record_cache(self.name, False)
+            return default
+        record_cache(self.name, True)
+        return value
+
+    def set(self, key, value):
+        """Store value if it can be pickled."""
+        try:
+            data = pickle.dumps(value, protocol=2)
+        except (AttributeError, pickle.PicklingError, TypeError):
+            return
+        atomic_write(self.path(key), data)
+
+
+class JSONCache(PickleCache):
+    """JSON documents stored in a subdirectory of the cache directory."""
+
+    def get(self, key, default=None):
+        """Return cached document or ``default``."""
+        try:
+            with open(self.path(key), 'rb') as data:
+                value = json.loads(data.read().decode('utf-8'))
+        except (EnvironmentError, ValueError):
+            record_cache(self.name, False)
+            return default
+        record_cache(self.name, True)
+        return value
+
+    def set(self, key, value):
+        """Store document if it can be encoded as JSON."""
+        try:
+            data = json.dumps(value, sort_keys=True)
+        except (TypeError, ValueError):
+            return
+        atomic_write(self.path(key), data.encode('utf-8'))
+
+
+def _sympy_name(name):
+    """Return SymPy class or singleton used by ``srepr``."""
+    value = getattr(sympy, name, None)
+    if isinstance(value, Basic) or (
+            isinstance(value, type) and issubclass(value, Basic)):
+        return value
+    raise ValueError('Unknown name {0!r}'.format(name))
+
+
+def parse_srepr(text):
+    """Return expression of ``srepr`` text without evaluating other code.
+
+    Only calls of SymPy classes with literal arguments are allowed.
+
+    :raises ValueError: if the text contains anything else.
+    """
+    tree = ast.parse(text, mode='eval')
+    namespace = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, _SREPR_NODES):
+            raise ValueError('Unexpected {0}'.format(type(node).__name__))
+        if isinstance(node, ast.Name):
+            namespace[node.id] = _sympy_name(node.id)
+    namespace['__builtins__'] = {}
+    return eval(compile(tree, '<srepr>', 'eval'), namespace)
+
+
+class ExpressionCache(PickleCache):
+    """SymPy expressions stored as ``srepr`` text.
+
+    Loading an entry never executes code, see :func:`parse_srepr`.
+    Symbols are stored by name and replaced by the symbols of the same
+    name passed to :meth:`get`, so that expressions of variables can be
+    cached.  Expressions that do not survive this round trip are not
+    stored.
+    """
+
+    def get(self, key, default=None, symbols=()):
+        """Return cached expression or ``default``."""
+        try:
+            with open(self.path(key), 'rb') as data:
+                value = parse_srepr(data.read().decode('utf-8'))
+        except (EnvironmentError, SyntaxError, TypeError, ValueError):
+            record_cache(self.name, False)
+            return default
+        record_cache(self.name, True)
+        return value.xreplace({Symbol(str(s)): s for s in symbols})
+
+    def set(self, key, value):
+        """Store expression if it can be restored from its ``srepr``."""
+        symbols = getattr(value, 'free_symbols', ())
+        try:
+            text = srepr(
+                value.xreplace({s: Symbol(str(s)) for s in symbols})
+            )
+            restored = parse_srepr(text).xreplace(
+                {Symbol(str(s)): s for s in symbols}
+            )
+        except (AttributeError, SyntaxError, TypeError, ValueError):
+            return
+        if restored == value:
+            atomic_write(self.path(key), text.encode('utf-8'))
@@ -23,18 +23,23 @@ import datetime
 import logging
 import os
 import re
-from collections import defaultdict
+import shutil
+import tempfile
+from collections import defaultdict, namedtuple
 
 import isort
 import pkg_resources
-from sympy import Eq, Function, latex, preorder_traversal
+from sympy import (Eq, Function, latex, Pow, preorder_traversal, S,
+                   Symbol)
+from sympy.core.cache import cacheit
 from sympy.physics.units import Quantity
 from yapf.yapflib.yapf_api import FormatCode
 
 import essm
 
 from .variables import Variable
-from .variables.utils import extract_variables, get_parents
+from .variables._core import BaseVariable
+from .variables.utils import get_parents
 
 logger = logging.getLogger()
 
@@ -81,13 +86,11 @@ class {name}(Variable):
     {expr}
 """
 
-# CONSTANTS = re.compile(r'\b(e|pi)\b')
-_IMPORTS = re.compile(
-    r'\b({0})\b'.format(
-        '|'.join(name for name in dir(essm) if not name.startswith('_'))
-    )
-)
-"""Regular expression to find specific constants and functions."""
+_IMPORTS = frozenset(name for name in dir(essm) if not name.startswith('_'))
+"""Names of specific constants and functions exported by essm."""
+
+Imports = namedtuple('Imports', 'functions units variables constants')
+"""Objects used in an expression that need to be imported."""
 
 
 def _lint_content(content):
@@ -97,6 +100,11 @@ def _lint_content(content):
     return content
 
 
+def _format_code(content):
+    """Format generated code without sorting imports."""
+    return FormatCode(content, style_config=STYLE_YAPF)[0]
+
+
 def extract_functions(expr):
     """Traverse through expression and return set of functions."""
     return {
@@ -113,7 +121,211 @@ def extract_units(expr):
     }
 
 
-class VariableWriter(object):
+def _printed_name(arg):
+    """Return name used for the node when printing the expression."""
+    if isinstance(arg, Eq):
+        return 'Eq'
+    if isinstance(arg, Pow) and arg.exp in (S.Half, -S.Half):
+        return 'sqrt'
+    if isinstance(arg, Symbol):
+        return arg.name
+    return type(arg).__name__
+
+
+@cacheit
+def collect_imports(expr):
+    """Return functions, units, variables and constants used in expression.
+
+    The expression is traversed only once and the result is cached.
+    Constants are names exported by essm that appear in the printed
+    expression.
+    """
+    functions, units, variables, constants = set(), set(), set(), set()
+    for arg in preorder_traversal(expr):
+        if isinstance(arg, Function):
+            functions.add(arg.func)
+        elif isinstance(arg, Quantity):
+            units.add(arg)
+        elif isinstance(arg, BaseVariable):
+            variables.add(arg)
+        name = _printed_name(arg)
+        if name in _IMPORTS:
+            constants.add(name)
+    return Imports(
+        frozenset(functions), frozenset(units), frozenset(variables),
+        frozenset(constants)
+    )
+
+
+class _ModuleWriter(object):
+    """Render a module with cached entries.
+
+    Each entry is rendered (and linted) once when the module is first
+    converted to a string after it has been added.  The complete module
+    is cached until entries, imports or the docstring change.  With
+    ``lint='deferred'`` the string conversion is not linted and only
+    :meth:`write` lints the output.
+
+    If a ``stream`` file name is given, entries are not kept in memory,
+    but rendered and written to a temporary file as they are added.  The
+    module with the header including all collected imports is written to
+    ``stream`` when the writer is closed, e.g. at the end of a ``with``
+    block.
+    """
+
+    separator = '\n'
+    """Separator of unlinted entries."""
+
+    def __init__(self, docstring=None, supplementary_imports={}, lint=True,
+                 stream=None):
+        """Initialize writer."""
+        if lint not in (True, False, 'deferred'):
+            raise ValueError('Unknown lint mode {0!r}'.format(lint))
+        self.docstring = docstring
+        self.lint = lint
+        self._imports = defaultdict(set)
+        self._imports.update(**self.default_imports)
+        self._imports.update(**supplementary_imports)
+        self._rendered = {False: [], True: []}
+        self._output = None
+        self._streamed = []
+        self.stream = stream
+        self._body = None
+        if stream is not None:
+            fd, self._body_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(stream)),
+                suffix='.body'
+            )
+            self._body = os.fdopen(fd, 'w')
+
+    def __enter__(self):
+        """Return itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the writer or discard the output on errors."""
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    @property
+    def names(self):
+        """Return names of all entries."""
+        return self._streamed + [entry['name'] for entry in self.entries]
+
+    def add_import(self, module, name):
+        """Import name from module in the generated code."""
+        self._imports[module].add(name)
+
+    @property
+    def imports(self):
+        """Yield registered imports."""
+        for key, values in sorted(self._imports.items()):
+            yield 'from {key} import {names}'.format(
+                key=key, names=', '.join(sorted(values))
+            )
+
+    def _lintable(self):
+        """Return true if the module can be linted."""
+        return True
+
+    def _render_entry(self, entry, lint):
+        """Return rendered entry."""
+        content = self.TPL.format(**entry).replace('^', '**')
+        return _format_code(content) if lint else content
+
+    def _add(self, entry):
+        """Add entry or write it to the stream."""
+        if self._body is None:
+            self.entries.append(entry)
+            return
+        lint = bool(self.lint) and self._lintable()
+        if lint:
+            prefix = '\n\n' if self._streamed or self._header() else ''
+            content = self._render_entry(entry, lint).rstrip('\n') + '\n'
+        else:
+            prefix = self.separator if self._streamed else ''
+            content = self._render_entry(entry, lint)
+        self._body.write(prefix + content)
+        self._streamed.append(entry['name'])
+
+    def close(self):
+        """Write the streamed module with its header and footer."""
+        if self._body is None:
+            return
+        body, self._body = self._body, None
+        lint = bool(self.lint) and self._lintable()
+        header, footer = self._header(), self._footer()
+        if lint:
+            header = _lint_content(header).rstrip('\n') + '\n' \
+                if header else ''
+            footer = '\n\n' + _format_code(footer).rstrip('\n') + '\n' \
+                if footer else ''
+        elif footer:
+            footer = '\n\n' + footer
+        body.close()
+        fd, path = tempfile.mkstemp(dir=os.path.dirname(self._body_path))
+        try:
+            with os.fdopen(fd, 'w') as out:
+                out.write(header)
+                with open(self._body_path) as data:
+                    shutil.copyfileobj(data, out)
+                out.write(footer)
+            getattr(os, 'replace', os.rename)(path, self.stream)
+        finally:
+            for name in (path, self._body_path):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    def discard(self):
+        """Remove streamed entries without writing the module."""
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+            os.remove(self._body_path)
+
+    def _render(self, lint):
+        """Return module rendered with cached entries."""
+        if self._body is not None:
+            raise ValueError('Streamed module is written on close()')
+        lint = lint and self._lintable()
+        entries = self.entries
+        key = (lint, self.docstring, tuple(self.imports), len(entries))
+        if self._output is not None and self._output[0] == key:
+            return self._output[1]
+
+        rendered = self._rendered[lint]
+        if len(rendered) > len(entries):
+            del rendered[:]
+        for entry in entries[len(rendered):]:
+            rendered.append(self._render_entry(entry, lint))
+
+        header, footer = self._header(), self._footer()
+        if lint:
+            parts = [_lint_content(header)] if header else []
+            parts += rendered
+            if footer:
+                parts.append(_format_code(footer))
+            result = '\n\n'.join(part.rstrip('\n') + '\n' for part in parts)
+        else:
+            result = header + self.separator.join(rendered)
+            if footer:
+                result += '\n\n' + footer
+        self._output = (key, result)
+        return result
+
+    def __str__(self):
+        """Serialize itself to string."""
+        return self._render(self.lint is True)
+
+    def write(self, filename):
+        """Serialize itself to a filename."""
+        with open(filename, 'w') as out:
+            out.write(self._render(bool(self.lint)))
+
+
+class VariableWriter(_ModuleWriter):
     """Generate Variable definitions.
 
     Example:
@@ -134,42 +346,41 @@ class VariableWriter(object):
         'essm.variables': {'Variable'},
     }
 
-    def __init__(self, docstring=None, supplementary_imports={}):
+    separator = '\n\n'
+
+    def __init__(self, docstring=None, supplementary_imports={}, lint=True,
+                 stream=None):
         """Initialize variable writer."""
-        self.docstring = docstring
-        self._imports = defaultdict(set)
-        self._imports.update(**self.default_imports)
-        self._imports.update(**supplementary_imports)
+        super(VariableWriter, self).__init__(
+            docstring, supplementary_imports, lint, stream
+        )
         self.vars = []
 
     @property
-    def imports(self):
-        """Yield used imports."""
-        for key, values in sorted(self._imports.items()):
-            yield 'from {key} import {names}'.format(
-                key=key, names=', '.join(sorted(values))
-            )
-
-    def __str__(self):
-        """Serialize itself to string."""
-        result = ''
-        if self.docstring:
-            result += self.LICENSE_TPL.format(
-                year=datetime.datetime.now().year
-            )
-            result += '"""' + self.docstring + '"""\n\n'
-            result += '\n'.join(self.imports) + '\n'
-        result += '\n\n'.join(
-            self.TPL.format(**var).replace('^', '**') for var in self.vars
+    def entries(self):
+        """Return list of variable contexts."""
+        return self.vars
+
+    def _lintable(self):
+        """Lint only complete modules with a docstring."""
+        return bool(self.docstring)
+
+    def _header(self):
+        """Return license, docstring and imports."""
+        if not self.docstring:
+            return ''
+        return self.LICENSE_TPL.format(
+            year=datetime.datetime.now().year
+        ) + '"""' + self.docstring + '"""\n\n' + \
+            '\n'.join(self.imports) + '\n'
+
+    def _footer(self):
+        """Return list of exported names."""
+        if not self.docstring:
+            return ''
+        return '__all__ = (\n{0}\n)'.format(
+            '\n'.join("    '{0}',".format(name) for name in self.names)
         )
-        if self.docstring:
-            result += '\n\n__all__ = (\n{0}\n)'.format(
-                '\n'.join(
-                    "    '{0}',".format(var['name']) for var in self.vars
-                )
-            )
-            result = _lint_content(result)
-        return result
 
     def newvar(
             self,
@@ -203,13 +414,13 @@ class VariableWriter(object):
             "expr": expr
 
         }
-        self.vars.append(context)
+        self._add(context)
 
         # register all imports of units
         if units:
             if units != 1:
                 for arg in extract_units(units):
-                    self._imports['sympy.physics.units'].add(str(arg))
+                    self.add_import('sympy.physics.units', str(arg))
 
     def var(self, var1):
         """Add pre-defined variable to writer.
@@ -235,13 +446,8 @@ class VariableWriter(object):
         expr = dict_attr.get('expr')
         self.newvar(name, doc, units, assumptions, latex_name, value, expr)
 
-    def write(self, filename):
-        """Serialize itself to a filename."""
-        with open(filename, 'w') as out:
-            out.write(str(self))
 
-
-class EquationWriter(object):
+class EquationWriter(_ModuleWriter):
     r"""Generate Equation definitions.
 
     Example:
@@ -281,39 +487,34 @@ class EquationWriter(object):
     }
     """Set up default imports, including standard division."""
 
-    def __init__(self, docstring=None, supplementary_imports={}):
+    def __init__(self, docstring=None, supplementary_imports={}, lint=True,
+                 stream=None):
         """Initialise equation writer."""
-        self.docstring = docstring
-        self._imports = defaultdict(set)
-        self._imports.update(**self.default_imports)
-        self._imports.update(**supplementary_imports)
+        super(EquationWriter, self).__init__(
+            docstring, supplementary_imports, lint, stream
+        )
         self.eqs = []
 
     @property
-    def imports(self):
-        """Yield registered imports."""
-        for key, values in sorted(self._imports.items()):
-            yield 'from {key} import {names}'.format(
-                key=key, names=', '.join(sorted(values))
-            )
+    def entries(self):
+        """Return list of equation contexts."""
+        return self.eqs
 
-    def __str__(self):
-        """Return string representation."""
+    def _header(self):
+        """Return license, docstring and imports."""
         result = ''
         if self.docstring:
             result += self.LICENSE_TPL.format(
                 year=datetime.datetime.now().year
             )
             result += '"""' + self.docstring + '"""\n\n'
-        result += '\n'.join(self.imports) + '\n'
-        result += '\n'.join(
-            self.TPL.format(**eq).replace('^', '**') for eq in self.eqs
-        )
-        result += '\n\n__all__ = (\n{0}\n)'.format(
-            '\n'.join("    '{0}',".format(eq['name']) for eq in self.eqs)
+        return result + '\n'.join(self.imports) + '\n'
+
+    def _footer(self):
+        """Return list of exported names."""
+        return '__all__ = (\n{0}\n)'.format(
+            '\n'.join("    '{0}',".format(name) for name in self.names)
         )
-        reformatted_result = _lint_content(result)
-        return reformatted_result
 
     def neweq(self, name, expr, doc='', parents=None, variables=None):
         """Add new equation."""
@@ -356,24 +557,26 @@ class EquationWriter(object):
             "parents": parents,
             "variables": variables,
         }
-        self.eqs.append(context)
+        self._add(context)
 
         # register all imports
-        for arg in extract_functions(expr):
-            self._imports['sympy'].add(str(arg))
+        imports = collect_imports(expr)
+        for arg in imports.functions:
+            self.add_import('sympy', str(arg))
 
-        for match in re.finditer(_IMPORTS, str(expr)) or []:
-            self._imports['sympy'].add(match.group())
+        for arg in imports.units:
+            self.add_import('sympy.physics.units', str(arg))
 
-        for arg in extract_variables(expr):
+        for arg in imports.variables:
             if str(arg) not in internal_variables and\
                     arg in Variable.__registry__:
-                self._imports[Variable.__registry__[arg].__module__].add(
-                    str(arg)
+                self.add_import(
+                    Variable.__registry__[arg].__module__, str(arg)
                 )
 
-        for match in re.finditer(_IMPORTS, str(expr)) or []:
-            self._imports['essm'].add(match.group())
+        for name in imports.constants:
+            self.add_import('sympy', name)
+            self.add_import('essm', name)
 
     def eq(self, eq1):
         """Add pre-defined equation to writer, incl. any internal variables.
@@ -391,8 +594,10 @@ class EquationWriter(object):
             print(writer)
         """
         dict_attr = eq1.definition.__dict__
-        int_vars = set(dict_attr.keys()) - \
-            {'__module__', '__doc__', 'name', 'expr'}
+        int_vars = sorted(
+            key for key, value in dict_attr.items()
+            if isinstance(value, BaseVariable)
+        )
         name = dict_attr.get('name')
         doc = dict_attr.get('__doc__')
         expr = dict_attr.get('expr')
@@ -408,8 +613,3 @@ class EquationWriter(object):
                       'default': d1.get('default')}
                      for d1 in int_vars_attr]
         self.neweq(name, expr, doc, parents, variables=variables)
-
-    def write(self, filename):
-        """Serialize itself to a filename."""
-        with open(filename, 'w') as out:
-            out.write(str(self))
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Opt-in instrumentation of hot paths.
+
+Call counts, cumulative times and cache hit rates are recorded per
+Variable or Equation definition inside the :func:`instrument` context:
+
+    >>> import essm
+    >>> with essm.instrument() as recorder:
+    ...     from essm.variables.physics.thermodynamics import *
+    >>> recorder.to_json()  # doctest: +SKIP
+
+Setting the ``ESSM_INSTRUMENT`` environment variable to a file name
+records the whole session and writes the JSON report to that file at
+exit.
+"""
+
+from __future__ import absolute_import
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+from collections import defaultdict
+from timeit import default_timer
+
+_ACTIVE = None
+"""Currently active recorder."""
+
+
+class Recorder(object):
+    """Collect call statistics of instrumented functions."""
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.calls = defaultdict(int)
+        self.time = defaultdict(float)
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self._local = threading.local()
+
+    @property
+    def _state(self):
+        """Return stack of definitions and active hooks of this thread."""
+        try:
+            return self._local.owners, self._local.active
+        except AttributeError:
+            self._local.owners, self._local.active = [None], set()
+            return self._local.owners, self._local.active
+
+    @property
+    def owner(self):
+        """Return name of the definition being built."""
+        return self._state[0][-1]
+
+    def call(self, hook, func, *args, **kwargs):
+        """Call function and record its statistics under ``hook``.
+
+        Only the outermost call of recursive functions is timed.
+        """
+        key = (hook, self.owner)
+        self.calls[key] += 1
+        active = self._state[1]
+        if hook in active:
+            return func(*args, **kwargs)
+        active.add(hook)
+        start = default_timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.time[key] += default_timer() - start
+            active.discard(hook)
+
+    @contextlib.contextmanager
+    def define(self, name):
+        """Attribute calls inside the ``with`` block to definition ``name``."""
+        owners = self._state[0]
+        owners.append(name)
+        key = ('define', name)
+        self.calls[key] += 1
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.time[key] += default_timer() - start
+            owners.pop()
+
+    def cache(self, name, hit):
+        """Record a cache hit or miss."""
+        key = (name, self.owner)
+        if hit:
+            self.hits[key] += 1
+        else:
+            self.misses[key] += 1
+
+    def rows(self):
+        """Return list of dictionaries with statistics per hook and owner."""
+        rows = []
+        for hook, owner in sorted(self.calls, key=str):
+            rows.append({
+                'hook': hook,
+                'owner': owner,
+                'calls': self.calls[hook, owner],
+                'time': self.time[hook, owner],
+            })
+        for name, owner in sorted(set(self.hits) | set(self.misses), key=str):
+            hits, misses = self.hits[name, owner], self.misses[name, owner]
+            rows.append({
+                'hook': name,
+                'owner': owner,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': float(hits) / (hits + misses),
+            })
+        return rows
+
+    def totals(self):
+        """Return statistics per hook summed over all owners."""
+        totals = defaultdict(lambda: defaultdict(float))
+        for row in self.rows():
+            for key, value in row.items():
+                if key not in ('hook', 'owner', 'hit_rate'):
+                    totals[row['hook']][key] += value
+        for values in totals.values():
+            if 'hits' in values:
+                values['hit_rate'] = values['hits'] / (
+                    values['hits'] + values['misses']
+                )
+        return {hook: dict(values) for hook, values in totals.items()}
+
+    def to_json(self, **kwargs):
+        """Serialize statistics to JSON."""
+        return json.dumps({
+            'rows': self.rows(),
+            'totals': self.totals()
+        }, **kwargs)
+
+    def table(self):
+        """Return statistics as a table that is rendered in notebooks."""
+        from .variables.utils import ListTable
+        cols = ('hook', 'owner', 'calls', 'time', 'hits', 'misses',
+                'hit_rate')
+        table = ListTable()
+        table.append(cols)
+        for row in self.rows():
+            table.append(tuple(row.get(col, '') for col in cols))
+        return table
+
+
+def instrumented(hook):
+    """Record calls of the decorated function when instrumentation is on."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE is None:
+                return func(*args, **kwargs)
+            return _ACTIVE.call(hook, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def defining(name, module=None):
+    """Attribute calls inside the ``with`` block to a new definition.
+
+    It does not add stack frames, so it can be used around code that
+    inspects the frame of the class statement.
+    """
+    if _ACTIVE is None:
+        return _NULL_CONTEXT
+    return _ACTIVE.define('{0}:{1}'.format(module, name))
+
+
+class _NullContext(object):
+    """Context manager doing nothing."""
+
+    def __enter__(self):
+        """Do nothing."""
+
+    def __exit__(self, *args):
+        """Do nothing."""
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+def record_cache(name, hit):
+    """Record a cache hit or miss when instrumentation is on."""
+    if _ACTIVE is not None:
+        _ACTIVE.cache(name, hit)
+
+
+@contextlib.contextmanager
+def instrument(recorder=None):
+    """Record statistics of hot paths inside the ``with`` block."""
+    global _ACTIVE
+    previous, _ACTIVE = _ACTIVE, recorder or Recorder()
+    try:
+        yield _ACTIVE
+    finally:
+        _ACTIVE = previous
+
+
+def _write_report(recorder, filename):
+    """Write JSON report of a recorder to a file."""
+    with open(filename, 'w') as out:
+        out.write(recorder.to_json(indent=2))
+
+
+if os.environ.get('ESSM_INSTRUMENT'):  # pragma: no cover
+    _ACTIVE = Recorder()
+    atexit.register(_write_report, _ACTIVE, os.environ['ESSM_INSTRUMENT'])
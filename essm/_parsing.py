@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Parsing of expressions given as strings.
+
+Expressions of library files and of records passed to ``define_many``
+are parsed without access to Python builtins, attributes or string
+literals.  Only numbers, arithmetic, comparisons, tuples, lists and
+calls of names are allowed, and names must refer to the given
+namespace or to SymPy classes and functions.
+"""
+
+from __future__ import absolute_import
+
+import ast
+
+import six
+import sympy
+import sympy.functions
+from sympy import Basic
+from sympy.parsing.sympy_parser import (convert_xor, parse_expr,
+                                        standard_transformations)
+
+_NODES = tuple(
+    getattr(ast, name) for name in (
+        'BinOp', 'Call', 'cmpop', 'Compare', 'Constant', 'Expression',
+        'keyword', 'List', 'Load', 'Name', 'NameConstant', 'Num',
+        'operator', 'Tuple', 'UnaryOp', 'unaryop'
+    ) if hasattr(ast, name)
+)
+
+_TRANSFORMATIONS = standard_transformations + (convert_xor, )
+
+_GLOBALS = {}
+"""SymPy classes, singletons and functions available in expressions."""
+
+
+def _globals():
+    """Return namespace of SymPy names without builtins."""
+    if not _GLOBALS:
+        _GLOBALS.update(
+            (name, value) for name, value in vars(sympy).items()
+            if isinstance(value, Basic) or (
+                isinstance(value, type) and issubclass(value, Basic))
+        )
+        _GLOBALS.update(
+            (name, getattr(sympy.functions, name))
+            for name in sympy.functions.__all__
+        )
+        _GLOBALS['__builtins__'] = {}
+    return _GLOBALS
+
+
+def check_expression(text):
+    """Check that text contains only allowed syntax and return its names.
+
+    :raises ValueError: if the text is not an allowed expression.
+    """
+    try:
+        tree = ast.parse(text.replace('^', '**'), mode='eval')
+    except SyntaxError as error:
+        raise ValueError('Invalid expression {0!r}: {1}'.format(text, error))
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES) or (
+                isinstance(node, getattr(ast, 'Constant', ())) and
+                isinstance(node.value, (six.binary_type, six.text_type))):
+            raise ValueError('{0} not allowed in expression {1!r}'.format(
+                type(node).__name__, text
+            ))
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+
+def parse_expression(text, namespace=None):
+    """Return expression of text using names from namespace.
+
+    :raises ValueError: if the text is not an allowed expression or if it
+                        contains unknown names.
+    """
+    namespace = dict(namespace or {})
+    unknown = {
+        name for name in check_expression(text)
+        if name not in namespace and (
+            name not in _globals() or name == '__builtins__')
+    }
+    if unknown:
+        raise ValueError('Unknown names {0} in expression {1!r}'.format(
+            ', '.join(sorted(unknown)), text
+        ))
+    return parse_expr(
+        text, local_dict=namespace, global_dict=_globals(),
+        transformations=_TRANSFORMATIONS
+    )
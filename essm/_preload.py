@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Preload libraries of variables and equations."""
+
+from __future__ import absolute_import
+
+import importlib
+import logging
+from collections import OrderedDict
+from timeit import default_timer
+
+logger = logging.getLogger(__name__)
+
+LIBRARIES = (
+    'essm.variables.physics.thermodynamics',
+    'essm.variables.leaf.energy_water',
+    'essm.variables.leaf.radiation',
+    'essm.variables.chamber.insulation',
+    'essm.variables.chamber.mass',
+    'essm.equations.physics.thermodynamics',
+    'essm.equations.leaf.energy_water',
+)
+"""Modules with pre-defined variables and equations."""
+
+
+def preload(modules=LIBRARIES, cache=True):
+    """Import libraries of variables and equations and return timings.
+
+    Units of expressions validated in previous runs are read from the
+    cache directory, so that their validation is skipped, and newly
+    validated expressions are stored for the next run.  Modules are
+    imported sequentially, because the import order decides which
+    definition wins when a variable is defined in several libraries.
+
+    Returns an ordered dictionary with the import time of each module in
+    seconds.  Modules imported before do not cause any work.
+    """
+    from .variables._core import VALIDATED_UNITS
+
+    if cache:
+        VALIDATED_UNITS.load()
+
+    timings = OrderedDict()
+    for module in modules:
+        start = default_timer()
+        importlib.import_module(module)
+        timings[module] = default_timer() - start
+        logger.info('Loaded %s in %.3f s', module, timings[module])
+
+    if cache:
+        VALIDATED_UNITS.save()
+    return timings
@@ -21,34 +21,380 @@
 
 from __future__ import absolute_import
 
+import contextlib
+import importlib
+import itertools
+import threading
 import warnings
+import weakref
+from collections import namedtuple
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping
+
+
+_GENERATIONS = itertools.count(1)
+
+RegistrySize = namedtuple('RegistrySize', 'permanent transient')
+
+
+def definition_key(definition):
+    """Return module and qualified name identifying a definition."""
+    return (
+        definition.__module__,
+        getattr(definition, '__qualname__', definition.__name__),
+    )
+
+
+class Registry(MutableMapping):
+    """Mapping with lock-protected writes and scoped overlays.
+
+    Inside :meth:`RegistryType.scope` all writes of the current thread go
+    to a copy-on-write overlay, while lookups fall through to the base
+    mapping.  The overlay is discarded when the scope is left.
+
+    While a transient :attr:`generation` is set in the current thread,
+    writes go to a layer holding its keys weakly, so that entries
+    disappear together with their keys.  Classes stored as values are
+    referenced weakly as well, because definitions refer to their
+    expressions.  Transient entries shadow permanent entries of the same
+    key, which become visible again when the transient ones are gone.
+    Keys which cannot be weakly referenced are stored in the base
+    mapping.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize base mapping."""
+        self._data = dict(*args, **kwargs)
+        self._weak = weakref.WeakKeyDictionary()
+        self._local = threading.local()
+        self.lock = threading.RLock()
+
+    @property
+    def _overlays(self):
+        """Return stack of overlays active in the current thread."""
+        try:
+            return self._local.overlays
+        except AttributeError:
+            self._local.overlays = []
+            return self._local.overlays
+
+    @property
+    def generation(self):
+        """Return generation of transient writes in the current thread."""
+        return getattr(self._local, 'generation', None)
+
+    @generation.setter
+    def generation(self, generation):
+        """Set generation of transient writes in the current thread."""
+        self._local.generation = generation
+
+    @property
+    def isolated(self):
+        """Check if writes of the current thread are scoped or transient."""
+        return bool(self._overlays) or self.generation is not None
+
+    def is_transient(self, key):
+        """Check if the base value of the key is transient."""
+        return self._get_transient(key) is not None
+
+    def _push_overlay(self):
+        """Start a new overlay in the current thread."""
+        self._overlays.append(({}, set()))
+
+    def _pop_overlay(self):
+        """Discard the innermost overlay of the current thread."""
+        self._overlays.pop()
+
+    def __getitem__(self, key):
+        """Return value from the innermost overlay defining the key."""
+        for data, deleted in reversed(self._overlays):
+            if key in data:
+                return data[key]
+            if key in deleted:
+                raise KeyError(key)
+        value = self._get_transient(key)
+        if value is None:
+            return self._data[key]
+        return value[1]
+
+    def _get_transient(self, key):
+        """Return generation and value of a live transient entry."""
+        if not self._weak:
+            return None
+        try:
+            generation, value = self._weak[key]
+        except (KeyError, TypeError):
+            return None
+        if isinstance(value, weakref.ref):
+            value = value()
+            if value is None:
+                return None
+        return generation, value
+
+    def _pop_transient(self, key):
+        """Remove transient entry and return true if it was present."""
+        try:
+            return self._weak.pop(key, None) is not None
+        except TypeError:  # key cannot be weakly referenced
+            return False
+
+    def _set_transient(self, key, value, generation):
+        """Store value in the weak layer and return true on success."""
+        if isinstance(value, type):
+            value = weakref.ref(value)
+        try:
+            self._weak[key] = (generation, value)
+        except TypeError:  # key cannot be weakly referenced
+            return False
+        return True
+
+    def __setitem__(self, key, value):
+        """Store value in the innermost overlay or in the base mapping."""
+        overlays = self._overlays
+        if overlays:
+            data, deleted = overlays[-1]
+            data[key] = value
+            deleted.discard(key)
+        else:
+            generation = self.generation
+            with self.lock:
+                if generation is None or not self._set_transient(
+                        key, value, generation):
+                    self._data[key] = value
+                    self._pop_transient(key)
+
+    def __delitem__(self, key):
+        """Remove value from the innermost overlay or the base mapping."""
+        overlays = self._overlays
+        if overlays:
+            if key not in self:
+                raise KeyError(key)
+            data, deleted = overlays[-1]
+            data.pop(key, None)
+            deleted.add(key)
+        else:
+            with self.lock:
+                if not self._pop_transient(key):
+                    del self._data[key]
+
+    def __contains__(self, key):
+        """Check if the key is visible in the current thread."""
+        for data, deleted in reversed(self._overlays):
+            if key in data:
+                return True
+            if key in deleted:
+                return False
+        return key in self._data or self._get_transient(key) is not None
+
+    def _transient_items(self):
+        """Return list of live transient keys and values."""
+        items = []
+        for key in list(self._weak.keys()):
+            value = self._get_transient(key)
+            if value is not None:
+                items.append((key, value))
+        return items
+
+    def __iter__(self):
+        """Iterate over keys visible in the current thread."""
+        with self.lock:
+            keys = list(self._data)
+            keys.extend(
+                key for key, _ in self._transient_items()
+                if key not in self._data
+            )
+        for data, deleted in self._overlays:
+            keys = [key for key in keys if key not in deleted
+                    and key not in data]
+            keys.extend(data)
+        return iter(keys)
+
+    def __len__(self):
+        """Return number of keys visible in the current thread."""
+        return sum(1 for _ in self)
+
+    def copy(self):
+        """Return a shallow copy as a dictionary."""
+        return dict(self.items())
+
+    @property
+    def size(self):
+        """Return number of permanent and live transient entries."""
+        with self.lock:
+            return RegistrySize(len(self._data), len(self._transient_items()))
+
+    def evict(self, generation=None):
+        """Remove transient entries up to ``generation`` (default all).
+
+        Return the number of removed live entries.
+        """
+        with self.lock:
+            evicted = [
+                key for key, value in self._transient_items()
+                if generation is None or value[0] <= generation
+            ]
+            for key in evicted:
+                del self._weak[key]
+        return len(evicted)
 
 
 class RegistryType(type):
     """Base registry operations."""
 
+    @contextlib.contextmanager
+    def scope(cls):
+        """Isolate registrations made in the current thread.
+
+        Definitions created inside the ``with`` block are visible only in
+        the current thread and are discarded on exit.
+        """
+        registries = [registry for _, registry in cls._registries()]
+        for registry in registries:
+            registry._push_overlay()
+        try:
+            yield cls
+        finally:
+            for registry in registries:
+                registry._pop_overlay()
+
+    def _registries(cls):
+        """Return registries defined on the class and its bases."""
+        return [
+            (name, value) for base in cls.__mro__
+            for name, value in vars(base).items()
+            if isinstance(value, Registry)
+        ]
+
+    @contextlib.contextmanager
+    def transient(cls):
+        """Register definitions of this class in the current thread weakly.
+
+        Registrations in the registries of the class are kept only as long
+        as their expressions (and classes) are referenced elsewhere, while
+        other classes, e.g. equations inside ``Variable.transient()``,
+        register permanently.  The generation number of the block is
+        returned, which can be passed to :meth:`evict` to drop the entries
+        explicitly.  Transient entries shadow permanent ones and are not
+        added to secondary indexes such as ``Variable.find`` or
+        ``Equation.descendants``.  Transient variables are new symbols, so
+        that the shared symbols of shadowed variables keep their
+        definitions.
+
+        Expressions are also referenced by the SymPy cache
+        (``sympy.core.cache``), so that they are reclaimed only after
+        they are dropped from it, e.g. by ``clear_cache()``.  Use
+        :meth:`evict` to remove the entries deterministically.
+        """
+        registries = [registry for _, registry in cls._registries()]
+        previous = [registry.generation for registry in registries]
+        generation = next(_GENERATIONS)
+        for registry in registries:
+            registry.generation = generation
+        try:
+            yield generation
+        finally:
+            for registry, value in zip(registries, previous):
+                registry.generation = value
+
+    def evict(cls, generation=None):
+        """Remove transient registrations up to ``generation``.
+
+        Return the number of evicted expressions.
+        """
+        evicted = cls.__registry__.evict(generation)
+        for _, registry in cls._registries():
+            registry.evict(generation)
+        return evicted
+
+    def sizes(cls):
+        """Return permanent and transient sizes of all registries."""
+        return {name: registry.size for name, registry in cls._registries()}
+
+    def resolve(cls, module, qualname):
+        """Return expression defined as ``qualname`` in ``module``.
+
+        The definition is looked up by importing the module first and by
+        searching the registry for locally or dynamically created
+        definitions.  Resolved expressions are cached.
+        """
+        key = (module, qualname)
+        if key in cls.__resolved__:
+            return cls.__resolved__[key]
+
+        try:
+            expr = importlib.import_module(module)
+            for name in qualname.split('.'):
+                expr = getattr(getattr(expr, 'definition', expr), name)
+        except (AttributeError, ImportError):
+            expr = None
+
+        if getattr(expr, 'definition', None) is None:
+            for expr, definition in list(cls.__registry__.items()):
+                if definition_key(definition) == key:
+                    break
+            else:
+                raise KeyError('{0}:{1}'.format(module, qualname))
+
+        cls.__resolved__[key] = expr
+        return expr
+
     def __setitem__(cls, expr, definition):
         """Register expression in registry."""
-        if expr in cls.__registry__:
+        with cls.__registry__.lock:
+            if expr in cls.__registry__:
+                warnings.warn(
+                    '"{0}" will be overridden by "{1}"'.format(
+                        cls.__registry__[expr].__module__ + ':' +
+                        cls.__registry__[expr].name,
+                        definition.__module__ + ':' + str(cls),
+                    ),
+                    stacklevel=2
+                )
+            cls._register(expr, definition)
+
+    def _register(cls, expr, definition):
+        """Store definition of expression without any warning."""
+        with cls.__registry__.lock:
+            cls.__registry__[expr] = definition
+        cls.__resolved__.pop(definition_key(definition), None)
+
+    def _register_many(cls, entries):
+        """Register pairs of expressions and definitions at once.
+
+        A single warning lists all overridden definitions.
+        """
+        overridden = []
+        with cls.__registry__.lock:
+            for expr, definition in entries:
+                if expr in cls.__registry__:
+                    previous = cls.__registry__[expr]
+                    overridden.append(
+                        previous.__module__ + ':' + previous.name
+                    )
+                cls._register(expr, definition)
+        if overridden:
             warnings.warn(
-                '"{0}" will be overridden by "{1}"'.format(
-                    cls.__registry__[expr].__module__ + ':' +
-                    cls.__registry__[expr].name,
-                    definition.__module__ + ':' + str(cls),
+                '{0} definitions will be overridden: {1}'.format(
+                    len(overridden), ', '.join(overridden)
                 ),
-                stacklevel=2
+                stacklevel=3
             )
-        cls.__registry__[expr] = definition
 
     def __delitem__(cls, expr):
         """Remove a expr from the registry."""
-        if expr in cls.__registry__:
+        with cls.__registry__.lock:
+            if expr not in cls.__registry__:
+                raise KeyError(expr)
             warnings.warn(
                 '"{0}" will be unregistered.'.format(
                     cls.__registry__[expr].__module__
                 ),
                 stacklevel=2
             )
+            cls.__resolved__.pop(
+                definition_key(cls.__registry__[expr]), None
+            )
             del cls.__registry__[expr]
-        else:
-            raise KeyError(expr)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Batch derivation of equations from their parents.
+
+A library of derived equations is described by a list of steps, each of
+which solves the equations of its parents for one variable while
+eliminating intermediate variables:
+
+.. code-block:: python
+
+   from essm.derivation import derive, Step
+   from essm._generator import EquationWriter
+   from essm.equations.physics.thermodynamics import (eq_Pa, eq_PN2_PO2,
+                                                      eq_rhoa_Pwa_Ta)
+   from essm.variables.physics.thermodynamics import P_N2, P_O2, rho_a
+
+   writer = EquationWriter(docstring='Derived equations.')
+   derive([
+       Step('eq_PO2', P_O2, [eq_Pa, eq_PN2_PO2], eliminate=[P_N2]),
+       Step('eq_PN2', P_N2, [eq_Pa, eq_PN2_PO2], eliminate=[P_O2]),
+       Step('eq_rhoa', rho_a, [eq_rhoa_Pwa_Ta, 'eq_PN2', 'eq_PO2'],
+            eliminate=[P_N2, P_O2]),
+   ], writer=writer)
+   writer.write('derived.py')
+
+Steps whose parents are available are solved in parallel worker
+processes, or in a pool or executor of the caller.  Their results are
+cached by a hash of the parent equations, so only steps with changed
+inputs are solved again.
+"""
+
+from __future__ import absolute_import
+
+import multiprocessing
+from collections import namedtuple, OrderedDict
+
+import six
+from sympy import Eq, solve, Symbol
+
+from ._cache import ExpressionCache
+from .equations import Equation
+from .variables._core import BaseVariable, validation_key
+
+DERIVATIONS = ExpressionCache('derivations')
+
+
+class Step(namedtuple('Step', 'name solve_for parents eliminate doc')):
+    """Derivation of equation name by solving parents.
+
+    The parents are equations or names of other steps.  The variables in
+    eliminate are solved for together with solve_for and thus
+    removed from the result.
+    """
+
+    def __new__(cls, name, solve_for, parents, eliminate=(), doc=None):
+        """Create new derivation step."""
+        return super(Step, cls).__new__(
+            cls, name, solve_for, tuple(parents), tuple(eliminate),
+            doc or 'Calculate {0} from {1}.'.format(
+                solve_for, ', '.join(map(_parent_name, parents))
+            )
+        )
+
+
+def _parent_name(parent):
+    """Return name of a parent equation or step."""
+    if isinstance(parent, six.string_types):
+        return parent
+    return parent.definition.name
+
+
+def _solve_step(exprs, solve_for, eliminate):
+    """Return the only solution of equations for solve_for."""
+    solutions = solve(exprs, [solve_for] + list(eliminate), dict=True)
+    solutions = [
+        solution[solve_for] for solution in solutions if solve_for in solution
+    ]
+    if len(solutions) != 1:
+        raise ValueError(
+            'Expected one solution for {0}, found {1}'.format(
+                solve_for, len(solutions)
+            )
+        )
+    return solutions[0]
+
+
+def _submit(pool, args, timeout):
+    """Solve a step in pool and return a function fetching its result.
+
+    Variables are sent to the workers as plain symbols, because workers
+    cannot unpickle variables that were defined after they started.
+    """
+    exprs, solve_for, eliminate = args
+    variables = set().union(*(expr.atoms(BaseVariable) for expr in exprs))
+    variables.update(
+        var for var in (solve_for, ) + tuple(eliminate)
+        if isinstance(var, BaseVariable)
+    )
+    plain = {var: Symbol(str(var), **var.assumptions0) for var in variables}
+    args = (
+        [expr.xreplace(plain) for expr in exprs],
+        plain.get(solve_for, solve_for),
+        [plain.get(var, var) for var in eliminate],
+    )
+    restore = {symbol: var for var, symbol in plain.items()}
+    if hasattr(pool, 'submit'):
+        result = pool.submit(_solve_step, *args).result
+    else:
+        result = pool.apply_async(_solve_step, args).get
+    return lambda: result(timeout).xreplace(restore)
+
+
+def _order(steps):
+    """Return steps grouped in waves of mutually independent steps."""
+    names = {step.name for step in steps}
+    if len(names) != len(steps):
+        raise ValueError('Duplicate step names')
+    done, waves, pending = set(), [], list(steps)
+    while pending:
+        wave = [
+            step for step in pending
+            if all(parent in done for parent in step.parents
+                   if isinstance(parent, six.string_types))
+        ]
+        if not wave:
+            raise ValueError('Unknown or cyclic parents of {0}'.format(
+                ', '.join(step.name for step in pending)
+            ))
+        waves.append(wave)
+        done.update(step.name for step in wave)
+        pending = [step for step in pending if step not in wave]
+    return waves
+
+
+def derive(steps, processes=None, writer=None, pool=None, timeout=None):
+    """Derive and register equations of all steps.
+
+    Independent steps are solved in pool, which is either a
+    multiprocessing pool or a concurrent.futures executor owned by the
+    caller.  Otherwise a pool of processes worker processes (all CPUs by
+    default, in the current process if it is 1) is created when needed
+    and closed before returning.  Errors of the workers are raised, and
+    waiting for a step longer than timeout seconds raises a timeout
+    error of the pool.  The derived equations inherit from their parents,
+    belong to the module of their first parent and are returned in an
+    ordered dictionary in the order of their dependencies.  If an
+    EquationWriter is given, the equations are added to it.
+    """
+    owned = None
+    derived = OrderedDict()
+    try:
+        for wave in _order(steps):
+            pending = []
+            for step in wave:
+                parents = [
+                    derived[parent]
+                    if isinstance(parent, six.string_types) else parent
+                    for parent in step.parents
+                ]
+                exprs = [Eq(parent.lhs, parent.rhs) for parent in parents]
+                key = (
+                    validation_key(*exprs), str(step.solve_for),
+                    tuple(map(str, step.eliminate))
+                )
+                args = (exprs, step.solve_for, step.eliminate)
+                symbols = set().union(*(expr.free_symbols for expr in exprs))
+                solution = DERIVATIONS.get(key, symbols=symbols)
+                fetch = None
+                if solution is None and len(wave) > 1 and (
+                        pool is not None or processes != 1):
+                    if pool is None and owned is None:
+                        owned = multiprocessing.Pool(processes)
+                    fetch = _submit(pool or owned, args, timeout)
+                elif solution is None:
+                    solution = _solve_step(*args)
+                    DERIVATIONS.set(key, solution)
+                pending.append((step, parents, key, solution, fetch))
+
+            for step, parents, key, solution, fetch in pending:
+                if fetch is not None:
+                    solution = fetch()
+                    DERIVATIONS.set(key, solution)
+                derived[step.name] = type(
+                    step.name,
+                    tuple(parent.definition for parent in parents), {
+                        '__doc__': step.doc,
+                        '__module__': parents[0].definition.__module__,
+                        '__source__': False,
+                        'expr': Eq(step.solve_for, solution),
+                    }
+                )
+    finally:
+        if owned is not None:
+            owned.terminate()
+            owned.join()
+
+    if writer is not None:
+        for step in steps:
+            for parent in step.parents:
+                if not isinstance(parent, six.string_types):
+                    writer.add_import(
+                        parent.definition.__module__, parent.definition.name
+                    )
+        parents = {step.name: step.parents for step in steps}
+        for name, expr in derived.items():
+            writer.neweq(
+                name, expr, doc=expr.definition.__doc__,
+                parents=[_parent_name(parent) for parent in parents[name]]
+            )
+    return derived
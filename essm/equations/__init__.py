@@ -39,6 +39,6 @@ You can import pre-defined equations as e.g.:
 
 from __future__ import absolute_import
 
-from ._core import Equation
+from ._core import CombinedEquation, Equation
 
-__all__ = ('Equation', )
+__all__ = ('CombinedEquation', 'Equation')
@@ -22,16 +22,66 @@
 
 from __future__ import absolute_import
 
+import contextlib
+import sys
 import warnings
+import weakref
+from collections import namedtuple
 
 import six
+from sympy import S, solve
 from sympy.core.relational import Eq
 
-from ..bases import RegistryType
+from .._cache import ExpressionCache
+from .._instrument import defining
+from .._parsing import parse_expression
+from ..bases import definition_key, Registry, RegistryType
 from ..transformer import build_instance_expression
 from ..variables import Variable
 from ..variables.units import derive_baseunit
-from ..variables._core import BaseVariable, Variable
+from ..variables._core import (_namespace, BaseVariable, VALIDATED_UNITS,
+                               validation_key, Variable)
+
+
+Signature = namedtuple(
+    'Signature', 'lhs inputs internal defaulted required variables'
+)
+"""Inputs of an equation.
+
+The ``lhs`` is the left-hand side and ``inputs`` are the variables on
+the right-hand side, which are either ``internal`` variables defined in
+the equation classes, ``defaulted`` variables with default values or
+``required``.  All tuples are sorted by name; ``variables`` contains the
+variables of the left-hand side followed by the inputs.
+"""
+
+
+def _signature(definition, expr):
+    """Return signature of an equation expression."""
+    if not isinstance(expr, Eq):
+        return Signature(expr, (), (), (), (), ())
+    internal = {
+        value for base in definition.__mro__
+        for value in vars(base).values() if isinstance(value, BaseVariable)
+    }
+
+    def variables(side):
+        return tuple(sorted(side.atoms(BaseVariable), key=str))
+
+    inputs = variables(expr.rhs)
+    lhs = variables(expr.lhs)
+    return Signature(
+        lhs=expr.lhs,
+        inputs=inputs,
+        internal=tuple(var for var in inputs if var in internal),
+        defaulted=tuple(
+            var for var in inputs if var in Variable.__defaults__
+        ),
+        required=tuple(
+            var for var in inputs if var not in Variable.__defaults__
+        ),
+        variables=lhs + tuple(var for var in inputs if var not in lhs),
+    )
 
 
 class EquationMeta(RegistryType):
@@ -96,64 +146,205 @@ class EquationMeta(RegistryType):
 
     def __new__(cls, name, parents, dct):
         """Build and register new variable."""
-        if '__registry__' not in dct:
+        if '__registry__' in dct:
+            return super(EquationMeta, cls).__new__(cls, name, parents, dct)
+
+        with defining(name, dct.get('__module__')):
             dct.setdefault('name', name)
             expr = dct.pop('expr')
+            source = dct.pop('__source__', True)
 
             instance = super(EquationMeta,
                              cls).__new__(cls, name, parents, dct)
-            expr = build_instance_expression(instance, expr)
+            expr = build_instance_expression(instance, expr, source=source)
             instance.expr = expr = BaseEquation(instance, expr)
+            instance.signature = _signature(instance, expr)
             instance[expr] = instance
 
             return expr
 
-        return super(EquationMeta, cls).__new__(cls, name, parents, dct)
+    @contextlib.contextmanager
+    def scope(cls):
+        """Isolate equations and variables defined in the current thread.
+
+        Internal variables of the equations defined inside the ``with``
+        block are discarded on exit as well.
+        """
+        with Variable.scope(), super(EquationMeta, cls).scope():
+            yield cls
+
+    def _register(cls, expr, definition):
+        """Register an equation and update the ancestry index."""
+        with cls.__registry__.lock:
+            # The index would keep transient definitions alive, and the
+            # shadowed permanent definitions stay indexed.
+            if cls.__registry__.generation is not None:
+                return super(EquationMeta, cls)._register(expr, definition)
+            if expr in cls.__registry__:
+                cls._update_ancestry(cls.__registry__[expr], remove=True)
+            super(EquationMeta, cls)._register(expr, definition)
+            cls._update_ancestry(definition)
+
+    def __delitem__(cls, expr):
+        """Remove an equation from the registry."""
+        with cls.__registry__.lock:
+            definition = cls.__registry__.get(expr)
+            super(EquationMeta, cls).__delitem__(expr)
+            cls._update_ancestry(definition, remove=True)
+
+    def _update_ancestry(cls, definition, remove=False):
+        """Add or remove a definition from the ancestry index."""
+        if remove:
+            ancestors = cls.__ancestors__.pop(definition, frozenset())
+        else:
+            ancestors = cls.ancestors(definition)
+            cls.__ancestors__[definition] = ancestors
+        for ancestor in ancestors:
+            descendants = cls.__descendants__.get(ancestor, frozenset())
+            if remove:
+                descendants = descendants - {definition}
+            else:
+                descendants = descendants | {definition}
+            cls.__descendants__[ancestor] = descendants
+
+    def define_many(cls, records, module=None):
+        """Define and register equations from a sequence of mappings.
+
+        Each record contains the ``name`` and ``expr`` and optionally the
+        ``doc`` and ``parents`` of an equation, where parents can be given
+        by the names of earlier records.  Expressions can be strings
+        referring to registered variables, e.g. ``'Eq(v, d/t)'``, which
+        are parsed without evaluating Python code.  The source code is not
+        inspected, all units are validated before any equation is
+        registered, and overridden equations are reported in one warning.
+        Return the list of defined equations.
+        """
+        if module is None:
+            module = sys._getframe(1).f_globals.get('__name__')
+        metaclass = type(cls)
+        namespace, prepared, pending = _namespace(Variable), [], {}
+        for record in records:
+            dct = dict(record)
+            name = dct.pop('name')
+            expr = dct.pop('expr')
+            if isinstance(expr, six.string_types):
+                expr = parse_expression(expr, namespace)
+            if isinstance(expr, Eq):
+                key = validation_key(expr)
+                if key not in VALIDATED_UNITS:
+                    pending.setdefault(key, expr)
+            parents = tuple(dct.pop('parents', ())) or (cls, )
+            if 'doc' in dct:
+                dct['__doc__'] = dct.pop('doc')
+            dct['__module__'] = module
+            dct.setdefault('name', name)
+            prepared.append((name, parents, dct, expr))
+
+        # The below raises an error if units are not consistent
+        for expr in pending.values():
+            Variable.check_unit(expr.lhs + expr.rhs)
+        for key in pending:
+            VALIDATED_UNITS.add(key)
+
+        created, defined = [], {}
+        for name, parents, dct, expr in prepared:
+            parents = tuple(
+                defined[parent] if isinstance(parent, six.string_types)
+                else getattr(parent, 'definition', parent)
+                for parent in parents
+            )
+            with defining(name, module):
+                instance = super(EquationMeta, metaclass).__new__(
+                    metaclass, name, parents, dct
+                )
+                instance.expr = expr = BaseEquation(instance, expr)
+                instance.signature = _signature(instance, expr)
+            defined[name] = instance
+            created.append((expr, instance))
+        cls._register_many(created)
+        return [expr for expr, _ in created]
+
+    def ancestors(cls, equation):
+        """Return frozenset of definitions an equation is derived from."""
+        definition = getattr(equation, 'definition', equation)
+        if definition in cls.__ancestors__:
+            return cls.__ancestors__[definition]
+        return frozenset().union(*(
+            {parent} | cls.ancestors(parent)
+            for parent in definition.__bases__ if hasattr(parent, 'name')
+        ))
+
+    def descendants(cls, equation):
+        """Return frozenset of registered definitions derived from equation."""
+        definition = getattr(equation, 'definition', equation)
+        return cls.__descendants__.get(definition, frozenset())
 
 
 @six.add_metaclass(EquationMeta)
 class Equation(object):
     """Base type for all equations."""
 
-    __registry__ = {}
+    __registry__ = Registry()
+    __resolved__ = Registry()
+    __solutions__ = Registry()
+    __ancestors__ = Registry()
+    __descendants__ = Registry()
+    __transient__ = weakref.WeakValueDictionary()
 
     @classmethod
     def args(cls):
         """Return equation arguments from registry if exist."""
         return tuple(
             Variable.__registry__.get(arg, arg)
-            for arg in cls.expr.atoms(BaseVariable)
+            for arg in cls.signature.variables
         )
 
 
-class BaseEquation(Eq):
-    """Add definition and short unit."""
+class EquationMixin(object):
+    """Methods shared by registered and combined equations.
 
-    def __new__(cls, definition, expr):
-        if not isinstance(expr, Eq):
-            return expr
-        # The below raises an error if units are not consistent
-        Variable.check_unit(expr.lhs + expr.rhs)
-        self = super(BaseEquation, cls).__new__(cls, *expr.args,
-                                                evaluate=False)
-        self.definition = definition
-        return self
+    Subclasses provide the ``definition`` of the equation.
+    """
 
     @property
-    def __doc__(self):
-        return self.definition.__doc__
+    def signature(self):
+        """Return :class:`Signature` of the equation inputs."""
+        return self.definition.signature
 
     def __add__(self, other):
         """Combine two equations."""
-        if not isinstance(other, Eq):
-            raise TypeError(other)
-
-        other_definition = getattr(other, 'definition', other)
-        return type(
-            str(self.definition) + '_and_' + str(other_definition),
-            (self.definition, other_definition),
-            {'expr': Eq(self.lhs + other.lhs, self.rhs + other.rhs)},
+        return CombinedEquation.combine(self, other)
+
+    def solve_for(self, variable, name=None):
+        """Return equation solved for ``variable``.
+
+        The solution is registered as a new equation inheriting from this
+        one, so that it keeps it as a parent.  Solutions are memoized in
+        memory and in the cache directory, so that repeated derivations
+        are not solved again in later sessions.
+
+        :raises ValueError: if there is not exactly one solution.
+        """
+        if variable == self.lhs:
+            return self
+        key = (self.definition, variable)
+        if key in Equation.__solutions__:
+            return Equation.__solutions__[key]
+
+        name = name or '{0}_{1}'.format(self.definition.name, variable)
+        expr = type(
+            name, (self.definition, ), {
+                '__doc__': '{0} solved for {1}.'.format(
+                    self.definition.name, variable
+                ),
+                '__module__': self.definition.__module__,
+                '__solved__': (self, variable),
+                '__source__': False,
+                'expr': Eq(variable, _solve(self, variable)),
+            }
         )
+        Equation.__solutions__[key] = expr
+        return expr
 
     def subs(self, *args, **kwargs):  # should mirror sympy.core.basic.subs
         r"""Return a new equation with subs applied to both sides.
@@ -195,4 +386,177 @@ class BaseEquation(Eq):
         )
 
 
-__all__ = ('Equation', 'EquationMeta')
+class BaseEquation(EquationMixin, Eq):
+    """Add definition and short unit."""
+
+    def __new__(cls, definition, expr):
+        if not isinstance(expr, Eq):
+            return expr
+        _check_unit(expr)
+        self = super(BaseEquation, cls).__new__(cls, *expr.args,
+                                                evaluate=False)
+        self.definition = definition
+        return self
+
+    @property
+    def __doc__(self):
+        return self.definition.__doc__
+
+    def __reduce__(self):
+        """Pickle equation as a reference to its definition.
+
+        Solutions created by :meth:`solve_for` are pickled as their parent
+        and variable, so that they can be solved again in other processes.
+        """
+        solved = self.definition.__dict__.get('__solved__')
+        if solved is not None:
+            return _solve_equation, solved + (self.definition.name, )
+        return _load_equation, definition_key(self.definition)
+
+    def __reduce_ex__(self, protocol):
+        """Pickle equation as a reference to its definition."""
+        return self.__reduce__()
+
+
+SOLUTIONS = ExpressionCache('solutions')
+
+
+class CombinedEquation(EquationMixin, Eq):
+    """Sum of equations that is not registered as a definition.
+
+    Combined equations are tracked only weakly by identity in
+    ``Equation.__transient__``, so they are garbage collected like other
+    expressions.  Their :attr:`definition` is created on first access and
+    inherits from the definitions of the parents, but it is only
+    registered using :meth:`register`.
+
+    :raises ValueError: if the units are inconsistent.
+    """
+
+    def __new__(cls, lhs, rhs, parents=(), **options):
+        """Create combined equation of ``parents``."""
+        options.setdefault('evaluate', False)
+        self = super(CombinedEquation, cls).__new__(cls, lhs, rhs, **options)
+        _check_unit(self)
+        self.parents = tuple(parents)
+        Equation.__transient__[id(self)] = self
+        return self
+
+    @property
+    def __doc__(self):
+        return self.definition.__doc__
+
+    @classmethod
+    def combine(cls, *equations):
+        """Return sum of equations."""
+        parents = []
+        for equation in equations:
+            if not isinstance(equation, Eq):
+                raise TypeError(equation)
+            parents.extend(getattr(equation, 'parents', None) or [equation])
+        return cls(
+            sum((parent.lhs for parent in parents), S.Zero),
+            sum((parent.rhs for parent in parents), S.Zero),
+            parents=parents,
+        )
+
+    def _parent_definitions(self):
+        """Return unique definitions of the parents."""
+        definitions = []
+        for parent in self.parents:
+            definition = getattr(parent, 'definition', None)
+            if definition is not None and definition not in definitions:
+                definitions.append(definition)
+        return definitions
+
+    @property
+    def definition(self):
+        """Return unregistered definition inheriting from the parents."""
+        if '_definition' not in self.__dict__:
+            definitions = self._parent_definitions()
+            names = [definition.name for definition in definitions]
+            metaclass = type(Equation)
+            definition = super(EquationMeta, metaclass).__new__(
+                metaclass, '_and_'.join(names) or 'combined',
+                tuple(definitions) or (Equation, ), {
+                    '__doc__': 'Sum of {0}.'.format(', '.join(names)),
+                    'name': '_and_'.join(names) or 'combined',
+                    'expr': self,
+                }
+            )
+            definition.signature = _signature(definition, self)
+            self._definition = definition
+        return self._definition
+
+    @property
+    def unit(self):
+        """Return base unit of both sides."""
+        if '_unit' not in self.__dict__:
+            self._unit = derive_baseunit(self.lhs)
+        return self._unit
+
+    def register(self, name=None, doc=None):
+        """Return registered equation derived from all parents."""
+        definition = self.definition
+        expr = type(name or definition.name, definition.__bases__, {
+            '__doc__': doc or definition.__doc__,
+            '__module__': sys._getframe(1).f_globals.get('__name__'),
+            '__source__': False,
+            'expr': Eq(self.lhs, self.rhs),
+        })
+        Equation.__transient__.pop(id(self), None)
+        return expr
+
+    def __reduce__(self):
+        """Pickle combined equation as the combination of its parents."""
+        if not self.parents:
+            return CombinedEquation, (self.lhs, self.rhs)
+        return _combine_equations, self.parents
+
+    def __reduce_ex__(self, protocol):
+        """Pickle combined equation as the combination of its parents."""
+        return self.__reduce__()
+
+
+def _combine_equations(*parents):
+    """Return unpickled combined equation."""
+    return CombinedEquation.combine(*parents)
+
+
+def _check_unit(expr):
+    """Raise an error if the units of an equation are not consistent."""
+    key = validation_key(expr)
+    if key not in VALIDATED_UNITS:
+        Variable.check_unit(expr.lhs + expr.rhs)
+        VALIDATED_UNITS.add(key)
+
+
+def _solve(expr, variable):
+    """Return the only solution of equation for variable using the cache."""
+    key = validation_key(expr, variable)
+    solution = SOLUTIONS.get(key, symbols=expr.free_symbols)
+    if solution is not None:
+        return solution
+
+    solutions = solve(expr, variable)
+    if len(solutions) != 1:
+        raise ValueError(
+            'Expected one solution of {0} for {1}, found {2}'.format(
+                expr, variable, len(solutions)
+            )
+        )
+    SOLUTIONS.set(key, solutions[0])
+    return solutions[0]
+
+
+def _load_equation(module, qualname):
+    """Return pickled equation from the registry."""
+    return Equation.resolve(module, qualname)
+
+
+def _solve_equation(parent, variable, name):
+    """Return unpickled solution of an equation."""
+    return parent.solve_for(variable, name=name)
+
+
+__all__ = ('CombinedEquation', 'Equation', 'EquationMeta')
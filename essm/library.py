@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Libraries of variables and equations stored as data.
+
+A library file in JSON, YAML or TOML format lists variables and equations
+with their units, defaults, docstrings and expressions as strings:
+
+.. code-block:: yaml
+
+   module: demo_library
+   imports:
+     - essm.equations.leaf.energy_water
+   variables:
+     - name: demo_d
+       unit: meter
+       doc: Distance.
+     - name: demo_v
+       unit: meter/second
+       default: 1
+     - name: demo_t
+       unit: second
+       expr: demo_d / demo_v
+   equations:
+     - name: eq_demo_v
+       doc: Velocity covering a distance.
+       expr: Eq(demo_v, demo_d / demo_t)
+     - name: eq_demo_d
+       doc: Distance covered at a given velocity.
+       expr: Eq(demo_d, demo_v * demo_t)
+       parents:
+         - eq_demo_v
+
+Modules listed in ``imports`` are imported first, so that expressions
+can use their variables.  Parents are names of earlier equations in the
+library or ``module:qualname`` references to other equations, e.g.
+``essm.equations.leaf.energy_water:eq_Elmol``.  Only modules of essm
+can be imported, while parents can also refer to modules that are
+already imported.  Units and expressions are parsed without evaluating
+Python code, see ``essm._parsing``.  The definitions are
+created with ``Variable.define_many`` and ``Equation.define_many``,
+which validate all units before registering them.  The validated
+records are cached as JSON by the content of the file, so that
+reloading an unchanged library neither decodes nor validates it again.
+
+YAML requires PyYAML and TOML requires Python 3.11 or the toml package.
+"""
+
+from __future__ import absolute_import
+
+import importlib
+import io
+import json
+import os
+import sys
+from collections import namedtuple
+
+import six
+import sympy.physics.units as u
+from sympy import S
+from sympy.physics.units import Quantity
+
+from ._cache import JSONCache, stable_hash
+from ._parsing import check_expression, parse_expression
+from .equations import Equation
+from .variables import Variable, units
+
+LIBRARIES = JSONCache('libraries')
+
+FORMATS = {
+    '.json': 'json',
+    '.toml': 'toml',
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+}
+"""File formats by file extension."""
+
+Library = namedtuple('Library', 'module variables equations')
+"""Module name and lists of defined variables and equations."""
+
+_UNITS = {}
+"""Units available in library files by name."""
+
+
+def _parse(data, format):
+    """Return document decoded from bytes in the given format."""
+    text = data.decode('utf-8')
+    if format == 'json':
+        return json.loads(text)
+    if format == 'yaml':
+        import yaml
+        return yaml.safe_load(text)
+    if format == 'toml':
+        try:
+            import tomllib
+        except ImportError:  # pragma: no cover
+            import toml as tomllib
+        return tomllib.loads(text)
+    raise ValueError('Unknown library format {0!r}'.format(format))
+
+
+def _unit(value):
+    """Return unit given as a string or number."""
+    if not isinstance(value, six.string_types):
+        return S(value)
+    if not _UNITS:
+        for namespace in (vars(u), vars(units)):
+            _UNITS.update(
+                (name, unit) for name, unit in namespace.items()
+                if isinstance(unit, Quantity)
+            )
+    return parse_expression(value, _UNITS)
+
+
+def _check_module(name, loaded=False):
+    """Check that name is an essm module or, if ``loaded``, imported.
+
+    :raises ValueError: if the module must not be imported.
+    """
+    if not isinstance(name, six.string_types) or (
+            name.split('.')[0] != 'essm' and
+            not (loaded and name in sys.modules)):
+        raise ValueError(
+            'Only essm modules can be imported: {0!r}'.format(name)
+        )
+
+
+def _parent(value):
+    """Return equation referenced as ``module:qualname`` or the name.
+
+    :raises ValueError: if the referenced equation is unknown.
+    """
+    if ':' not in value:
+        return value
+    module, qualname = value.split(':', 1)
+    _check_module(module, loaded=True)
+    try:
+        return Equation.resolve(module, qualname)
+    except KeyError:
+        raise ValueError('Unknown parent equation {0!r}'.format(value))
+
+
+def _record(record, kind):
+    """Return copy of a record with a name."""
+    if not isinstance(record, dict) or not isinstance(
+            record.get('name'), six.string_types):
+        raise ValueError('Expected {0} with a name: {1!r}'.format(
+            kind, record
+        ))
+    return dict(record)
+
+
+def _records(document):
+    """Return validated records of a decoded library file.
+
+    :raises ValueError: if the document is not a valid library.
+    """
+    if not isinstance(document, dict):
+        raise ValueError('Expected a mapping of library entries')
+    unknown = set(document) - {'module', 'imports', 'variables', 'equations'}
+    if unknown:
+        raise ValueError('Unknown library entries {0}'.format(
+            ', '.join(sorted(unknown))
+        ))
+    imports = list(document.get('imports', ()))
+    for name in imports:
+        _check_module(name)
+
+    variables = []
+    for record in document.get('variables', ()):
+        record = _record(record, 'variable')
+        for key in ('unit', 'expr'):
+            if isinstance(record.get(key), six.string_types):
+                check_expression(record[key])
+        variables.append(record)
+    equations = []
+    for record in document.get('equations', ()):
+        record = _record(record, 'equation')
+        if not isinstance(record.get('expr'), six.string_types):
+            raise ValueError('Expected expression of {0}'.format(
+                record['name']
+            ))
+        check_expression(record['expr'])
+        record['parents'] = list(record.get('parents', ()))
+        if not all(isinstance(parent, six.string_types)
+                   for parent in record['parents']):
+            raise ValueError('Expected names of parents of {0}'.format(
+                record['name']
+            ))
+        for parent in record['parents']:
+            if ':' in parent:
+                _check_module(parent.split(':', 1)[0], loaded=True)
+        equations.append(record)
+    return {
+        'module': document.get('module'),
+        'imports': imports,
+        'variables': variables,
+        'equations': equations,
+    }
+
+
+def read_library(path, format=None, cache=True):
+    """Return validated records of a library file.
+
+    The format is guessed from the file extension if not given.  The
+    records are cached by a hash of the file content.
+
+    :raises ValueError: if the file is not a valid library.
+    """
+    if format is None:
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in FORMATS:
+            raise ValueError('Unknown library format {0!r}'.format(extension))
+        format = FORMATS[extension]
+    with io.open(path, 'rb') as source:
+        data = source.read()
+
+    key = stable_hash(format, data)
+    records = LIBRARIES.get(key) if cache else None
+    if records is None:
+        records = _records(_parse(data, format) or {})
+        if cache:
+            LIBRARIES.set(key, records)
+    return records
+
+
+def load_library(path, format=None, module=None, cache=True):
+    """Define variables and equations of a library file.
+
+    The definitions belong to ``module``, which defaults to the ``module``
+    entry of the file or its base name.  If ``cache`` is true, the
+    validated records and the units validated in previous runs are read
+    from the cache directory.  Return a :class:`Library` with the defined
+    expressions.
+
+    :raises ValueError: if the file is not a valid library.
+    """
+    from .variables._core import VALIDATED_UNITS
+
+    document = read_library(path, format=format, cache=cache)
+    module = module or document.get('module') or os.path.splitext(
+        os.path.basename(path)
+    )[0]
+    for name in document['imports']:
+        importlib.import_module(name)
+
+    variables = []
+    for record in document['variables']:
+        record = dict(record)
+        if 'unit' in record:
+            record['unit'] = _unit(record['unit'])
+        variables.append(record)
+    equations = []
+    for record in document['equations']:
+        record = dict(record)
+        record['parents'] = [_parent(parent) for parent in record['parents']]
+        equations.append(record)
+
+    if cache:
+        VALIDATED_UNITS.load()
+    library = Library(
+        module,
+        Variable.define_many(variables, module=module),
+        Equation.define_many(equations, module=module),
+    )
+    if cache:
+        VALIDATED_UNITS.save()
+    return library
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Numerical evaluation of equations.
+
+Equations can be compiled to vectorized kernels operating on arrays of
+float64 values in the units of the respective variables.  If a C
+compiler is available, the kernels are generated as C code, compiled
+to a shared library and cached in the cache directory; otherwise they
+are evaluated using NumPy.  The module requires NumPy (pip install
+essm[numerics]).
+
+Example:
+
+.. code-block:: python
+
+   import numpy as np
+   from essm.numerics import compile_equations
+   from essm.equations.physics.thermodynamics import eq_Nu_forced_all
+
+   kernel = compile_equations([eq_Nu_forced_all])
+   Nu, = kernel(Pr=0.71, Re=np.linspace(1e3, 1e4, 100), Re_c=3000)
+
+Partial derivatives for sensitivity analyses are derived symbolically
+and evaluated together with the value in one pass over the data:
+
+.. code-block:: python
+
+   from essm.numerics import compile_gradient
+   from essm.variables.physics.thermodynamics import Re
+
+   kernel = compile_gradient(eq_Nu_forced_all, [Re])
+   Nu, (dNu_dRe, ) = kernel(Pr=0.71, Re=np.linspace(1e3, 1e4, 100),
+                            Re_c=3000)
+
+Equations with derivatives with respect to time are integrated over
+many scenarios at once using the fixed-step classical Runge-Kutta
+method (RK4):
+
+.. code-block:: python
+
+   from sympy import Derivative
+   from essm import Eq
+   from essm.equations import Equation
+   from essm.numerics import ODESystem
+   from essm.variables import Variable
+   from essm.variables.chamber.mass import F_in_mola, F_out_mola, n_c
+   from essm.variables.units import second
+
+   class t_c(Variable):
+       '''Time since closing the chamber.'''
+
+       unit = second
+
+   class eq_dnc(Equation):
+       '''Change of dry air in the chamber.'''
+
+       expr = Eq(Derivative(n_c, t_c), F_in_mola - F_out_mola)
+
+   system = ODESystem([eq_dnc], time=t_c,
+                      parameters=[F_in_mola, F_out_mola])
+   states = system.integrate({n_c: 1.0}, times=np.linspace(0, 60, 61),
+                             parameters={F_in_mola: [0.1, 0.2],
+                                         F_out_mola: 0.15})
+"""
+
+from __future__ import absolute_import
+
+from ._core import (compile_equations, compile_gradient, GradientKernel,
+                    Kernel)
+from .ode import ODESystem
+from .uncertainty import propagate_uncertainty
+
+__all__ = ('compile_equations', 'compile_gradient', 'GradientKernel',
+           'Kernel', 'ODESystem', 'propagate_uncertainty')
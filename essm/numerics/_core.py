@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Vectorized kernels generated from equations."""
+
+from __future__ import absolute_import
+
+import ctypes
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+from sympy import (cse, Derivative, diff, Dummy, lambdify, numbered_symbols,
+                   S, Symbol)
+from sympy.physics.units import Quantity
+
+from .._cache import cache_dir, stable_hash
+from ..variables import Variable
+from ..variables._core import BaseVariable
+from ..variables.units import derive_unit
+
+try:
+    from sympy.printing.c import C99CodePrinter
+except ImportError:  # pragma: no cover
+    from sympy.printing.ccode import C99CodePrinter
+
+logger = logging.getLogger(__name__)
+
+C_TPL = """#include <math.h>
+
+void essm_kernel(long n, const double **inputs, double **outputs)
+{{
+    long i;
+{constants}
+    for (i = 0; i < n; i++) {{
+{body}
+    }}
+}}
+"""
+
+_LIBRARIES = {}
+"""Shared libraries loaded in this process."""
+
+_LOCK = threading.Lock()
+
+_c_double_p = ctypes.POINTER(ctypes.c_double)
+
+
+class Kernel(object):
+    """Vectorized evaluation of a sequence of assignments.
+
+    The assignments are pairs of a symbol and an expression, which are
+    evaluated in order and can use the inputs as well as previously
+    assigned symbols.  Calling the kernel with arrays (or scalars) for
+    the inputs returns a tuple of arrays for the outputs.
+    """
+
+    def __init__(self, inputs, assignments, outputs, backend='auto'):
+        """Generate and compile the kernel."""
+        if backend not in ('auto', 'c', 'numpy'):
+            raise ValueError('Unknown backend {0!r}'.format(backend))
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+        # Replace variables by plain symbols with valid identifiers.
+        names = {
+            symbol: Symbol('x{0}'.format(i))
+            for i, symbol in enumerate(self.inputs)
+        }
+        assigned = []
+        for i, (symbol, expr) in enumerate(assignments):
+            if expr.atoms(Quantity):
+                raise ValueError(
+                    'Expression of {0} contains units: {1}'.format(
+                        symbol, expr
+                    )
+                )
+            unknown = expr.free_symbols - set(names)
+            if unknown:
+                raise ValueError(
+                    'Expression of {0} depends on unknown {1}'.format(
+                        symbol, ', '.join(sorted(map(str, unknown)))
+                    )
+                )
+            expr = expr.xreplace(names)
+            names[symbol] = Symbol('y{0}'.format(i))
+            assigned.append((names[symbol], expr))
+        self._assignments = assigned
+        self._names = [names[symbol] for symbol in self.inputs]
+        self._results = [names[symbol] for symbol in self.outputs]
+
+        self.source = None
+        self._func = None
+        if backend in ('auto', 'c'):
+            try:
+                self.source = self._generate_c()
+                self._func = _load_library(self.source).essm_kernel
+                self._func.argtypes = [
+                    ctypes.c_long,
+                    ctypes.POINTER(_c_double_p),
+                    ctypes.POINTER(_c_double_p),
+                ]
+                self._func.restype = None
+                self.backend = 'c'
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                if backend == 'c':
+                    raise
+                logger.info('Using NumPy backend: %s', e)
+        if self._func is None:
+            self._numpy = [
+                (symbol, lambdify(
+                    self._names + [name for name, _ in assigned[:i]],
+                    expr, 'numpy'
+                ))
+                for i, (symbol, expr) in enumerate(assigned)
+            ]
+            self.backend = 'numpy'
+
+    def _generate_c(self):
+        """Return C source of the kernel."""
+        constants, body = set(), []
+        for i, name in enumerate(self._names):
+            body.append('const double {0} = inputs[{1}][i];'.format(name, i))
+        for name, expr in self._assignments:
+            printer = C99CodePrinter({'human': False})
+            number_symbols, not_supported, code = printer.doprint(expr)
+            if not_supported:
+                raise ValueError('Not supported in C: {0}'.format(
+                    ', '.join(sorted(map(str, not_supported)))
+                ))
+            constants.update(number_symbols)
+            body.append('const double {0} = {1};'.format(name, code))
+        for i, name in enumerate(self._results):
+            body.append('outputs[{0}][i] = {1};'.format(i, name))
+        return C_TPL.format(
+            constants='\n'.join(
+                '    const double {0} = {1};'.format(name, value)
+                for name, value in sorted(constants, key=str)
+            ),
+            body='\n'.join(8 * ' ' + line for line in body),
+        )
+
+    def __call__(self, *args, **kwargs):
+        """Evaluate kernel for given input values."""
+        if len(args) + len(kwargs) != len(self.inputs):
+            raise TypeError('Expected values for {0}'.format(
+                ', '.join(map(str, self.inputs))
+            ))
+        try:
+            values = list(args) + [
+                kwargs.pop(str(symbol)) for symbol in self.inputs[len(args):]
+            ]
+        except KeyError as e:
+            raise TypeError('Missing value for {0}'.format(e))
+        values = np.broadcast_arrays(
+            *[np.asarray(value, dtype=np.float64) for value in values]
+        )
+        shape = values[0].shape if values else ()
+
+        if self.backend == 'numpy':
+            env = [value for value in values]
+            for symbol, func in self._numpy:
+                env.append(np.broadcast_to(func(*env), shape))
+            index = {name: i for i, (name, _) in enumerate(self._numpy)}
+            return tuple(
+                np.array(env[len(values) + index[name]], dtype=np.float64)
+                for name in self._results
+            )
+
+        values = [np.ascontiguousarray(value).ravel() for value in values]
+        results = [np.empty(shape, dtype=np.float64) for _ in self.outputs]
+        self._func(
+            int(np.prod(shape, dtype=np.int64)),
+            (_c_double_p * len(values))(
+                *[value.ctypes.data_as(_c_double_p) for value in values]
+            ),
+            (_c_double_p * len(results))(
+                *[result.ctypes.data_as(_c_double_p) for result in results]
+            ),
+        )
+        return tuple(results)
+
+
+def _load_library(source):
+    """Compile C source to a cached shared library and load it.
+
+    The compiler can be set using the ``CC`` environment variable and the
+    compile flags using ``ESSM_CFLAGS`` or ``CFLAGS``.  The default
+    ``-O2`` keeps IEEE semantics and builds portable kernels.  Flags like
+    ``-O3 -ffast-math -march=native`` allow vectorized math functions,
+    but assume finite values and the CPU of the build host, so they must
+    be enabled explicitly.  The shared library is linked without these
+    flags, so that they do not change floating point settings of the
+    whole process.
+    """
+    compiler = os.environ.get('CC', 'cc')
+    flags = (
+        os.environ.get('ESSM_CFLAGS') or os.environ.get('CFLAGS') or '-O2'
+    ).split()
+    key = stable_hash(source, compiler, flags, platform.node())
+    with _LOCK:
+        if key in _LIBRARIES:
+            return _LIBRARIES[key]
+        path = os.path.join(cache_dir('kernels'), key + '.so')
+        if not os.path.exists(path):
+            build = tempfile.mkdtemp(dir=cache_dir('kernels'))
+            try:
+                with open(os.path.join(build, 'kernel.c'), 'w') as out:
+                    out.write(source)
+                for command in (
+                        flags + ['-fPIC', '-c', 'kernel.c'],
+                        ['-shared', '-o', 'kernel.so', 'kernel.o', '-lm'],
+                ):
+                    subprocess.check_output(
+                        [compiler] + command,
+                        cwd=build, stderr=subprocess.STDOUT,
+                    )
+                os.rename(os.path.join(build, 'kernel.so'), path)
+            finally:
+                shutil.rmtree(build, ignore_errors=True)
+        _LIBRARIES[key] = ctypes.CDLL(path)
+        return _LIBRARIES[key]
+
+
+def _substitute_defaults(expr, keep):
+    """Replace variables not in ``keep`` by their default values."""
+    return expr.xreplace({
+        variable: S(Variable.__defaults__[variable])
+        for variable in expr.atoms(BaseVariable)
+        if variable not in keep and variable in Variable.__defaults__
+    })
+
+
+def _free_symbols(exprs, exclude=()):
+    """Return sorted free symbols of expressions."""
+    return sorted(
+        set().union(*(expr.free_symbols for expr in exprs)) - set(exclude),
+        key=str
+    )
+
+
+def compile_equations(equations, inputs=None, defaults=True, backend='auto'):
+    """Return kernel computing the left-hand sides of ``equations``.
+
+    The equations are evaluated in the given order, so that later
+    equations can use the results of earlier ones.  Variables that are
+    not listed in ``inputs`` are replaced by their default values if
+    ``defaults`` is true.  If ``inputs`` is not given, all remaining
+    variables without default values are used in alphabetical order.
+    The ``backend`` can be ``'c'``, ``'numpy'`` or ``'auto'``, which
+    falls back to NumPy if the C code cannot be compiled.
+    """
+    assignments, assigned = [], set()
+    for equation in equations:
+        expr = equation.rhs
+        if defaults:
+            expr = _substitute_defaults(
+                expr, assigned | set(inputs or ())
+            )
+        assignments.append((equation.lhs, expr))
+        assigned.add(equation.lhs)
+
+    if inputs is None:
+        inputs = _free_symbols((expr for _, expr in assignments), assigned)
+    return Kernel(
+        inputs, assignments, [symbol for symbol, _ in assignments],
+        backend=backend
+    )
+
+
+class GradientKernel(object):
+    """Kernel returning value and gradient of an equation.
+
+    The partial derivatives of the right-hand side with respect to
+    ``variables`` are derived symbolically, their common subexpressions
+    are eliminated and the result is compiled into a single kernel.
+    """
+
+    def __init__(self, equation, variables, inputs=None, defaults=True,
+                 backend='auto'):
+        """Derive and compile the gradient."""
+        self.equation = equation
+        self.variables = tuple(variables)
+        expr = equation.rhs
+        if defaults:
+            expr = _substitute_defaults(
+                expr, set(self.variables) | set(inputs or ())
+            )
+        self.derivatives = tuple(
+            diff(expr, variable) for variable in self.variables
+        )
+        self.units = tuple(
+            derive_unit(Derivative(equation.lhs, variable))
+            for variable in self.variables
+        )
+
+        if inputs is None:
+            inputs = _free_symbols((expr, ), ())
+            inputs += [var for var in self.variables if var not in inputs]
+        replacements, reduced = cse(
+            (expr, ) + self.derivatives,
+            symbols=numbered_symbols('cse', cls=Dummy),
+        )
+        results = [Dummy(str(equation.lhs))] + [
+            Dummy('d_{0}'.format(variable)) for variable in self.variables
+        ]
+        self.kernel = Kernel(
+            inputs, list(replacements) + list(zip(results, reduced)),
+            results, backend=backend
+        )
+        self.inputs = self.kernel.inputs
+
+    def __call__(self, *args, **kwargs):
+        """Return value and gradient with derivatives along first axis."""
+        results = self.kernel(*args, **kwargs)
+        return results[0], np.stack(results[1:])
+
+
+def compile_gradient(equation, variables, inputs=None, defaults=True,
+                     backend='auto'):
+    """Return kernel computing value and gradient of an equation.
+
+    Calling the kernel returns the right-hand side of ``equation`` and an
+    array with its partial derivatives with respect to ``variables``
+    stacked along the first axis.  The units of the derivatives are
+    available as ``kernel.units``.  See :func:`compile_equations` for the
+    remaining arguments.
+    """
+    return GradientKernel(
+        equation, variables, inputs=inputs, defaults=defaults,
+        backend=backend
+    )
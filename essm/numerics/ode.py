@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Integration of ordinary differential equations.
+
+Equations of the form Eq(Derivative(x, t), rhs) define the rates of
+change of the state variables x with respect to the time variable
+t.  Their right-hand sides are compiled into a single vectorized
+kernel, so that many chambers or scenarios are integrated at once by
+passing arrays for the initial states and parameters.  The integration
+uses the classical Runge-Kutta method (RK4) with fixed steps.
+"""
+
+from __future__ import absolute_import
+
+import numpy as np
+from sympy import Derivative, Dummy, Eq
+
+from ..variables._core import BaseVariable, Variable
+from ._core import _free_symbols, _substitute_defaults, Kernel
+
+
+def _values(symbols, mapping):
+    """Return values of mapping ordered like symbols."""
+    mapping = {str(key): value for key, value in mapping.items()}
+    unknown = set(mapping) - set(map(str, symbols))
+    if unknown:
+        raise KeyError('Unknown variables {0}'.format(
+            ', '.join(sorted(unknown))
+        ))
+    missing = [str(symbol) for symbol in symbols if str(symbol) not in mapping]
+    if missing:
+        raise KeyError('Missing values for {0}'.format(', '.join(missing)))
+    return [
+        np.asarray(mapping[str(symbol)], dtype=np.float64)
+        for symbol in symbols
+    ]
+
+
+class ODESystem(object):
+    """System of ordinary differential equations in time.
+
+    The equations are either rate equations with a derivative of a
+    state variable with respect to time on the left-hand side, or
+    auxiliary equations defining a variable used by the rates.  The
+    auxiliary equations are evaluated in the given order before the
+    rates.  Variables that are neither states nor parameters are
+    replaced by their default values if defaults is true.  If
+    parameters is not given, all remaining variables are used in
+    alphabetical order.
+
+    :raises ValueError: if an equation is not of the supported form or
+                        if its units are inconsistent.
+    """
+
+    def __init__(self, equations, time, parameters=None, defaults=True,
+                 backend='auto'):
+        """Check units of the equations and compile the rates."""
+        self.time = time
+        states, rates, auxiliary = [], [], []
+        for equation in equations:
+            if not isinstance(equation, Eq):
+                raise ValueError('Not an equation: {0}'.format(equation))
+            if not hasattr(equation, 'definition'):
+                Variable.check_unit(equation.lhs + equation.rhs)
+            lhs = equation.lhs
+            if isinstance(lhs, BaseVariable):
+                auxiliary.append((lhs, equation.rhs))
+            elif (isinstance(lhs, Derivative) and
+                  isinstance(lhs.expr, BaseVariable) and
+                  tuple(lhs.variable_count) == ((time, 1), )):
+                if lhs.expr in states:
+                    raise ValueError('Duplicate rate of {0}'.format(
+                        lhs.expr
+                    ))
+                states.append(lhs.expr)
+                rates.append(equation.rhs)
+            else:
+                raise ValueError(
+                    'Expected derivative with respect to {0}: {1}'.format(
+                        time, equation
+                    )
+                )
+        if not states:
+            raise ValueError('No rate equations given')
+        self.states = tuple(states)
+
+        keep = set(states) | {time} | {symbol for symbol, _ in auxiliary}
+        if parameters is not None:
+            keep |= set(parameters)
+        if defaults:
+            auxiliary = [
+                (symbol, _substitute_defaults(expr, keep))
+                for symbol, expr in auxiliary
+            ]
+            rates = [_substitute_defaults(expr, keep) for expr in rates]
+        if parameters is None:
+            parameters = _free_symbols(
+                [expr for _, expr in auxiliary] + rates, keep
+            )
+        self.parameters = tuple(parameters)
+
+        outputs = [Dummy('d_{0}'.format(state)) for state in states]
+        self.kernel = Kernel(
+            (time, ) + self.states + self.parameters,
+            auxiliary + list(zip(outputs, rates)), outputs,
+            backend=backend
+        )
+
+    def rates(self, time, states, parameters):
+        """Return array of rates with states along the first axis."""
+        return np.stack(np.broadcast_arrays(
+            *self.kernel(time, *(tuple(states) + tuple(parameters)))
+        ))
+
+    def integrate(self, initial, times, parameters=None, substeps=1):
+        """Integrate the system using the fixed-step classical RK4 method.
+
+        The initial states and parameters map variables or their
+        names to scalars or arrays, which are broadcast against each
+        other.  The states are reported at times, taking substeps
+        equal steps between consecutive times without error control.
+        The result has the shape (len(times), len(states)) + shape of
+        the broadcast inputs.
+
+        :raises ValueError: if times is not a non-empty sequence.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if times.ndim != 1 or not len(times):
+            raise ValueError('Expected a non-empty sequence of times')
+        values = np.broadcast_arrays(
+            *(_values(self.states, initial) +
+              _values(self.parameters, parameters or {}))
+        )
+        count = len(self.states)
+        state = np.stack(values[:count]).astype(np.float64)
+        parameters = values[count:]
+        result = np.empty((len(times), ) + state.shape)
+        result[0] = state
+        for i in range(1, len(times)):
+            step = (times[i] - times[i - 1]) / substeps
+            for j in range(substeps):
+                time = times[i - 1] + j * step
+                k1 = self.rates(time, state, parameters)
+                k2 = self.rates(time + step / 2, state + step / 2 * k1,
+                                parameters)
+                k3 = self.rates(time + step / 2, state + step / 2 * k2,
+                                parameters)
+                k4 = self.rates(time + step, state + step * k3, parameters)
+                state = state + step / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            result[i] = state
+        return result
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of essm.
+# Copyright (C) 2017 ETH Zurich, Swiss Data Science Center.
+#
+# essm is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# essm is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with essm; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""Propagation of uncertainties through equations.
+
+Uncertainties are given as standard deviations of independent, normally
+distributed inputs.  The linear method uses the first-order Taylor
+expansion with symbolically derived gradients, while the Monte Carlo
+method evaluates batches of random samples in single vectorized calls.
+"""
+
+from __future__ import absolute_import
+
+import numpy as np
+
+from ..variables._core import BaseVariable
+from ._core import compile_equations, compile_gradient
+
+
+def _by_name(equation, mapping):
+    """Return mapping with variables of the equation as keys."""
+    variables = {str(var): var for var in equation.rhs.atoms(BaseVariable)}
+    result = {}
+    for key, value in mapping.items():
+        if str(key) not in variables:
+            raise KeyError('{0} is not a variable of {1}'.format(
+                key, equation
+            ))
+        result[variables[str(key)]] = np.asarray(value, dtype=np.float64)
+    return result
+
+
+def propagate_uncertainty(equation, values, uncertainties, method='taylor',
+                          samples=1000, chunk_size=10 ** 6, seed=None,
+                          backend='auto'):
+    """Return mean and standard deviation of the right-hand side.
+
+    The values and uncertainties (standard deviations) map
+    variables or their names to scalars or arrays, which are broadcast
+    against each other, so that each element describes one row of data.
+    Variables without values are replaced by their defaults.
+
+    With method='montecarlo' the equation is evaluated for
+    samples random draws per row, processing at most chunk_size
+    evaluations at once to bound memory use.  Without uncertainties,
+    the standard deviation is zero.
+    """
+    if method not in ('taylor', 'montecarlo'):
+        raise ValueError('Unknown method {0!r}'.format(method))
+    values = _by_name(equation, values)
+    uncertainties = _by_name(equation, uncertainties)
+    missing = set(uncertainties) - set(values)
+    if missing:
+        raise KeyError('Missing values of {0}'.format(
+            ', '.join(sorted(map(str, missing)))
+        ))
+    inputs = sorted(values, key=str)
+    uncertain = sorted(uncertainties, key=str)
+    arrays = np.broadcast_arrays(*(
+        [values[var] for var in inputs] +
+        [uncertainties[var] for var in uncertain]
+    ))
+    shape = arrays[0].shape if arrays else ()
+    arrays = {
+        key: array.ravel()
+        for key, array in zip(
+            inputs + [(var, 'std') for var in uncertain], arrays
+        )
+    }
+
+    if not uncertain:
+        kernel = compile_equations([equation], inputs=inputs, backend=backend)
+        mean = np.broadcast_to(
+            kernel(*(arrays[var] for var in inputs))[0].reshape(shape), shape
+        )
+        return mean, np.zeros(shape)
+
+    if method == 'taylor':
+        kernel = compile_gradient(
+            equation, uncertain, inputs=inputs, backend=backend
+        )
+        mean, gradient = kernel(*(arrays[var] for var in inputs))
+        std = np.sqrt(sum(
+            (gradient[i] * arrays[var, 'std']) ** 2
+            for i, var in enumerate(uncertain)
+        ))
+        return mean.reshape(shape), np.asarray(std).reshape(shape)
+
+    kernel = compile_equations([equation], inputs=inputs, backend=backend)
+    rng = np.random.RandomState(seed)
+    size = int(np.prod(shape, dtype=np.int64))
+    mean, std = np.empty(size), np.empty(size)
+    step = max(1, chunk_size // samples)
+    for start in range(0, size, step):
+        rows = slice(start, min(start + step, size))
+        count = rows.stop - rows.start
+        draws = []
+        for var in inputs:
+            value = arrays[var][rows, np.newaxis]
+            if var in uncertainties:
+                value = value + arrays[var, 'std'][rows, np.newaxis] * \
+                    rng.standard_normal((count, samples))
+            draws.append(np.broadcast_to(value, (count, samples)))
+        result, = kernel(*draws)
+        mean[rows] = result.mean(axis=1)
+        std[rows] = result.std(axis=1, ddof=1)
+    return mean.reshape(shape), std.reshape(shape)
@@ -23,10 +23,25 @@ from __future__ import absolute_import
 
 import ast
 import inspect
+import linecache
 import sys
+import threading
 
 from sympy.core import numbers
 
+from ._instrument import instrumented
+
+try:
+    from collections import ChainMap
+except ImportError:  # pragma: no cover
+
+    def ChainMap(*maps):
+        """Merge mappings with the first one taking precedence."""
+        merged = {}
+        for mapping in reversed(maps):
+            merged.update(mapping)
+        return merged
+
 _Number = ast.parse('numbers.Number', mode='eval').body
 
 
@@ -89,29 +104,92 @@ def unindent(source):
     return source
 
 
-def build_instance_expression(instance, expr, back=1):
-    """Return fixed expression."""
+_SOURCES = {}
+"""Parsed class statements by file name.
+
+Each value contains the source lines returned by :mod:`linecache`, the
+class definition nodes by line number and the compiled expressions.
+"""
+
+_SOURCES_LOCK = threading.Lock()
+
+
+def _compiled_expression(instance, frame):
+    """Return compiled expression of the class statement run in frame.
+
+    Every source file is parsed only once, so that defining many classes
+    in one module does not parse the module again for every class.
+    Return ``None`` if the class statement cannot be found.
+    """
+    filename = frame.f_code.co_filename
+    lines = linecache.getlines(filename, frame.f_globals)
+    if not lines:
+        return None
+    with _SOURCES_LOCK:
+        source = _SOURCES.get(filename)
+        if source is None or source[0] is not lines:
+            try:
+                tree = ast.parse(''.join(lines), filename)
+            except (SyntaxError, ValueError):
+                return None
+            source = _SOURCES[filename] = (lines, {
+                node.lineno: node for node in ast.walk(tree)
+                if isinstance(node, ast.ClassDef)
+            }, {})
+        _, nodes, compiled = source
+        lineno = frame.f_lineno
+        if lineno not in compiled:
+            node = nodes.get(lineno)
+            if node is None or node.name != instance.__name__:
+                return None
+            class_def = ClassDef()
+            class_def.visit(node)
+            compiled[lineno] = class_def.expr
+        return compiled[lineno]
+
+
+def build_instance_expression(instance, expr, back=1, source=True):
+    """Return fixed expression.
+
+    Expressions of classes created at runtime, e.g. by ``type()``, are
+    returned as they are when ``source`` is false, since the source of the
+    class cannot be found or would belong to another class.
+    """
+    if not source:
+        return expr
+    # Evaluate expression in the original context.
+    frame = sys._getframe(back + 1)
+    return _evaluate_instance_expression(instance, expr, frame)
+
+
+@instrumented('build_instance_expression')
+def _evaluate_instance_expression(instance, expr, frame):
+    """Evaluate expression from the class source in the frame context."""
     from .variables._core import BaseVariable
     try:
-        # Evaluate expression in the original context.
-        frame = sys._getframe(back + 1)
-
         # Find original code and convert numbers.
-        code = ast.parse(unindent(inspect.getsource(instance)))
-        class_def = ClassDef()
-        class_def.visit(code)
+        compiled = _compiled_expression(instance, frame)
+        if compiled is None:
+            code = ast.parse(unindent(inspect.getsource(instance)))
+            class_def = ClassDef()
+            class_def.visit(code)
+            compiled = class_def.expr
 
         # Include names used during number replacement.
-        f_globals = frame.f_globals.copy()
-        extend_globals(f_globals)
-
-        # Include locally defined variables.
-        f_locals = frame.f_locals.copy()
-        for name in dir(instance):
-            data = getattr(instance, name)
-            if isinstance(data, BaseVariable):
-                f_locals[name] = data
-        expr = eval(class_def.expr, f_globals, f_locals)
+        extra = {}
+        extend_globals(extra)
+
+        # Include variables defined in the class and its bases.
+        attributes = {}
+        for base in reversed(instance.__mro__[:-1]):
+            attributes.update(
+                (name, data) for name, data in vars(base).items()
+                if isinstance(data, BaseVariable)
+            )
+
+        # Look names up without copying the (possibly large) namespaces.
+        f_locals = ChainMap(attributes, frame.f_locals, extra)
+        expr = eval(compiled, frame.f_globals, f_locals)
     except (IOError, TypeError):  # pragma: no cover
         pass
 
@@ -22,6 +22,7 @@
 
 from __future__ import absolute_import
 
+import sys
 import warnings
 
 import six
@@ -32,9 +33,12 @@ from sympy.physics.units import (Dimension, Quantity, convert_to)
 from sympy.physics.units.systems.si import dimsys_SI, SI
 from sympy.physics.units.util import check_dimensions
 
-from ..bases import RegistryType
+from .._cache import HashSet, stable_hash
+from .._instrument import defining, instrumented
+from .._parsing import parse_expression
+from ..bases import definition_key, Registry, RegistryType
 from ..transformer import build_instance_expression
-from .units import derive_unit, derive_base_dimension
+from .units import derive_base_dimension, derive_unit, markdown
 
 
 class VariableMeta(RegistryType):
@@ -42,84 +46,253 @@ class VariableMeta(RegistryType):
 
     def __new__(cls, name, parents, dct):
         """Build and register new variable."""
-        if '__registry__' not in dct:
-            unit = dct.pop('unit', S.One)
-            if unit == 1:
-                unit = S.One
-            definition = dct.pop('expr', None)
-
-            dct.setdefault('name', name)
-            dct.setdefault('assumptions', {'real': True})
-            dct.setdefault('latex_name', dct['name'])
-            dct.setdefault('unit', unit)
+        if '__registry__' in dct:
+            return super(VariableMeta, cls).__new__(cls, name, parents, dct)
 
+        with defining(name, dct.get('__module__')):
+            unit, definition = _variable_attributes(name, dct)
             instance = super(VariableMeta,
                              cls).__new__(cls, name, parents, dct)
 
             # Variable with definition expression.
             if definition is not None:
                 definition = build_instance_expression(instance, definition)
-                derived_unit = derive_unit(definition, name=name)
-
-                if unit == S.One:
-                    unit = derived_unit  # only if unit is None
+                unit, key = _definition_unit(name, definition, unit)
+                if key is not None:
+                    VALIDATED_UNITS.add(key)
                 instance.expr, instance.unit = definition, unit
 
-                dim_derived = dimsys_SI.get_dimensional_dependencies(
-                    Variable.get_dimensional_expr(derived_unit)
-                )
-                dim_unit = dimsys_SI.get_dimensional_dependencies(
-                    Variable.get_dimensional_expr(unit)
-                )
-                if dim_derived != dim_unit:
-                    raise ValueError(
-                        'Invalid expression units {0} should be {1}'.format(
-                            instance.unit, unit
-                        )
-                    )
-
-            expr = BaseVariable(
-                instance,
-                dct['name'],
-                abbrev=dct['latex_name'],
-                dimension=Dimension(SI.get_dimensional_expr(unit)),
-                scale_factor=unit or S.One,
-                **dct['assumptions']
+            # Scoped and transient variables must not change the
+            # definition of the symbol that SymPy shares process-wide.
+            expr = _variable_expression(
+                instance, dct, unit, cached=not instance.__registry__.isolated
             )
             instance[expr] = instance
-
-            # Store definition as variable expression.
-            if definition is not None:
-                instance.__expressions__[expr] = definition
-
-            # Store default variable only if it is defined.
-            if 'default' in dct:
-                instance.__defaults__[expr] = dct['default']
-
-            # Store unit for each variable:
-            instance.__units__[expr] = unit
-
+            instance._store(expr, definition, dct, unit)
             return expr
 
-        return super(VariableMeta, cls).__new__(cls, name, parents, dct)
+    def _store(cls, expr, definition, dct, unit):
+        """Store expression, default value and unit of a variable."""
+        # Store definition as variable expression.
+        if definition is not None:
+            cls.__expressions__[expr] = definition
+
+        # Store default variable only if it is defined.
+        if 'default' in dct:
+            cls.__defaults__[expr] = dct['default']
+
+        # Store unit for each variable and pre-render it for tables.
+        cls.__units__[expr] = unit
+        markdown(unit)
+
+    def define_many(cls, records, module=None):
+        """Define and register variables from a sequence of mappings.
+
+        Each record contains the ``name`` and optionally the ``unit``,
+        ``default``, ``latex_name``, ``assumptions``, ``expr`` and ``doc``
+        of a variable.  Expressions can be strings referring to registered
+        variables or to variables of earlier records, which are parsed
+        without evaluating Python code.  The source code is
+        not inspected, all units are validated before any variable is
+        registered, and overridden variables are reported in one warning.
+        Return the list of defined variables.
+        """
+        if module is None:
+            module = sys._getframe(1).f_globals.get('__name__')
+        metaclass = type(cls)
+        # Validate all records using new symbols, because SymPy returns
+        # cached symbols of existing variables, which must not be changed
+        # before the whole batch is valid.
+        namespace, prepared, keys = _namespace(cls), [], set()
+        for record in records:
+            dct = dict(record)
+            name = dct.pop('name')
+            if 'doc' in dct:
+                dct['__doc__'] = dct.pop('doc')
+            dct['__module__'] = module
+            with defining(name, module):
+                unit, definition = _variable_attributes(name, dct)
+                instance = super(VariableMeta, metaclass).__new__(
+                    metaclass, name, (cls, ), dct
+                )
+                if definition is not None:
+                    if isinstance(definition, six.string_types):
+                        definition = parse_expression(definition, namespace)
+                    unit, key = _definition_unit(name, definition, unit)
+                    keys.add(key)
+                    instance.expr, instance.unit = definition, unit
+            namespace[dct['name']] = _variable_expression(
+                instance, dct, unit, cached=False
+            )
+            prepared.append((instance, definition, dct, unit))
+
+        cached = not cls.__registry__.isolated
+        created = [
+            (_variable_expression(instance, dct, unit, cached), instance,
+             definition, dct, unit)
+            for instance, definition, dct, unit in prepared
+        ]
+        for key in keys - {None}:
+            VALIDATED_UNITS.add(key)
+        with cls.__registry__.lock:
+            cls._register_many(
+                (expr, instance) for expr, instance, _, _, _ in created
+            )
+            for expr, instance, definition, dct, unit in created:
+                instance._store(expr, definition, dct, unit)
+        return [expr for expr, _, _, _, _ in created]
+
+    def _register(cls, expr, definition):
+        """Register a variable and update the secondary indexes."""
+        with cls.__registry__.lock:
+            # The indexes would keep transient variables alive, and the
+            # shadowed permanent variables stay indexed.
+            if cls.__registry__.generation is not None:
+                return super(VariableMeta, cls)._register(expr, definition)
+            if expr in cls.__registry__:
+                cls._update_indexes(expr, cls.__registry__[expr], remove=True)
+            super(VariableMeta, cls)._register(expr, definition)
+            cls._update_indexes(expr, definition)
 
     def __delitem__(cls, expr):
         """Remove a variable from the registry."""
-        super(VariableMeta, cls).__delitem__(expr)
+        with cls.__registry__.lock:
+            definition = cls.__registry__.get(expr)
+            transient = cls.__registry__.is_transient(expr)
+            super(VariableMeta, cls).__delitem__(expr)
+            if not transient:
+                cls._update_indexes(expr, definition, remove=True)
         for name in ('__units__', '__defaults__', '__expressions__'):
             registry = getattr(cls, name)
             if expr in registry:
                 del registry[expr]
 
+    def _update_indexes(cls, expr, definition, remove=False):
+        """Add or remove a variable from the secondary indexes."""
+        keys = (
+            (cls.__names__, str(expr)),
+            (cls.__dimensions__, _dimension_key(definition.unit)),
+            (cls.__modules__, definition.__module__),
+        )
+        for index, key in keys:
+            variables = index.get(key, frozenset())
+            if remove:
+                variables = variables - {expr}
+            else:
+                variables = variables | {expr}
+            if variables:
+                index[key] = variables
+            elif key in index:
+                del index[key]
+
+    def find(cls, name=None, dimension=None, module=None):
+        """Return registered variables matching all given criteria.
+
+        The ``dimension`` can be given as a dimension, a unit or a
+        variable, e.g. ``Variable.find(dimension=pressure)``.
+        """
+        result = None
+        for index, key in (
+                (cls.__names__, name),
+                (cls.__dimensions__, dimension),
+                (cls.__modules__, module),
+        ):
+            if key is None:
+                continue
+            if index is cls.__dimensions__:
+                key = _dimension_key(key)
+            variables = index.get(key, frozenset())
+            result = variables if result is None else result & variables
+        return frozenset(cls.__registry__) if result is None else result
+
+
+def _variable_attributes(name, dct):
+    """Return unit and expression and set default attributes."""
+    unit = dct.pop('unit', S.One)
+    if unit == 1:
+        unit = S.One
+    definition = dct.pop('expr', None)
+
+    dct.setdefault('name', name)
+    dct.setdefault('assumptions', {'real': True})
+    dct.setdefault('latex_name', dct['name'])
+    dct.setdefault('unit', unit)
+    return unit, definition
+
+
+def _definition_unit(name, definition, unit):
+    """Return unit of a definition and its validation key.
+
+    The unit is derived from the definition if not given.
+
+    :raises ValueError: if the dimensions do not match.
+    """
+    key = None
+    if unit != S.One:
+        key = validation_key(definition, unit)
+    if key is None or key not in VALIDATED_UNITS:
+        derived_unit = derive_unit(definition, name=name)
+
+        if unit == S.One:
+            unit = derived_unit  # only if unit is None
+
+        dim_derived = dimsys_SI.get_dimensional_dependencies(
+            Variable.get_dimensional_expr(derived_unit)
+        )
+        dim_unit = dimsys_SI.get_dimensional_dependencies(
+            Variable.get_dimensional_expr(unit)
+        )
+        if dim_derived != dim_unit:
+            raise ValueError(
+                'Invalid expression units {0} should be {1}'
+                .format(derived_unit, unit)
+            )
+    return unit, key
+
+
+def _variable_expression(instance, dct, unit, cached=True):
+    """Return variable expression of a definition.
+
+    If ``cached`` is false, a new symbol is returned even if SymPy holds
+    an equal one, so that existing variables keep their definitions,
+    e.g. while validating records or inside scopes and transient blocks.
+    """
+    if not cached:
+        assumptions = dict(dct['assumptions'], abbrev=dct['latex_name'])
+        Symbol._sanitize(assumptions, BaseVariable)
+        expr = Symbol.__xnew__(BaseVariable, dct['name'], **assumptions)
+        expr.definition = instance
+        return expr
+    return BaseVariable(
+        instance,
+        dct['name'],
+        abbrev=dct['latex_name'],
+        dimension=Dimension(SI.get_dimensional_expr(unit)),
+        scale_factor=unit or S.One,
+        **dct['assumptions']
+    )
+
+
+def _namespace(cls):
+    """Return registered variables with unique names."""
+    return {
+        name: next(iter(variables))
+        for name, variables in cls.__names__.items() if len(variables) == 1
+    }
+
 
 @six.add_metaclass(VariableMeta)
 class Variable(object):
     """Base type for all physical variables."""
 
-    __registry__ = {}
-    __defaults__ = {}
-    __units__ = {}
-    __expressions__ = {}
+    __registry__ = Registry()
+    __resolved__ = Registry()
+    __defaults__ = Registry()
+    __units__ = Registry()
+    __expressions__ = Registry()
+    __names__ = Registry()
+    __dimensions__ = Registry()
+    __modules__ = Registry()
 
     @staticmethod
     def get_dimensional_expr(expr):
@@ -156,6 +329,7 @@ class Variable(object):
         return S.One
 
     @staticmethod
+    @instrumented('check_unit')
     def check_unit(expr):
         """Check if base dimensions of expression are consistent.
 
@@ -243,6 +417,40 @@ class Variable(object):
             return expr, Dimension(1)
 
 
+VALIDATED_UNITS = HashSet('validated_units')
+"""Hashes of expressions with already validated units."""
+
+
+def _expression_key(expr):
+    """Return nested tuple describing expression and units of variables."""
+    if isinstance(expr, BaseVariable):
+        return ('BaseVariable', expr.name,
+                _expression_key(expr.definition.unit))
+    if isinstance(expr, Quantity):
+        return ('Quantity', str(expr), str(SI.get_quantity_dimension(expr)),
+                str(SI.get_quantity_scale_factor(expr)))
+    if getattr(expr, 'args', None):
+        return (type(expr).__name__, ) + tuple(
+            _expression_key(arg) for arg in expr.args
+        )
+    return (type(expr).__name__, str(expr))
+
+
+def validation_key(*exprs):
+    """Return stable hash of expressions including units of variables."""
+    return stable_hash(*(_expression_key(expr) for expr in exprs))
+
+
+def _dimension_key(expr):
+    """Return hashable base dimension vector of a unit or dimension."""
+    if not isinstance(expr, Dimension):
+        expr = Variable.get_dimensional_expr(expr)
+    return tuple(sorted(
+        dimsys_SI.get_dimensional_dependencies(expr).items(),
+        key=lambda item: str(item[0])
+    ))
+
+
 class BaseVariable(Symbol):
     """Physical variable."""
 
@@ -271,7 +479,21 @@ class BaseVariable(Symbol):
     def _latex(self, printer):
         return self.definition.latex_name
 
+    def __reduce__(self):
+        """Pickle variable as a reference to its definition."""
+        return _load_variable, definition_key(self.definition)
+
+    def __reduce_ex__(self, protocol):
+        """Pickle variable as a reference to its definition."""
+        return self.__reduce__()
+
+
+def _load_variable(module, qualname):
+    """Return pickled variable from the registry."""
+    return Variable.resolve(module, qualname)
+
 
+@instrumented('Add postprocessor')
 def _Quantity_constructor_postprocessor_Add(expr):
     """Construct postprocessor for the addition.
 
@@ -35,6 +35,8 @@ from sympy.physics.units.definitions.dimension_definitions import (
                                             voltage)
 from sympy.physics.units.systems.si import dimsys_SI, SI
 
+from .._instrument import instrumented, record_cache
+
 candela = u.candela
 coulomb = u.coulomb
 farad = u.farad
@@ -72,8 +74,27 @@ SI_EXTENDED_DIMENSIONS = {
 }
 
 
+_MARKDOWN = {}
+"""Cached markdown representations of units."""
+
+
 def markdown(unit):
-    """Return markdown representation of a unit."""
+    """Return markdown representation of a unit.
+
+    The representations are cached per unit expression.
+    """
+    try:
+        result = _MARKDOWN[unit]
+    except KeyError:
+        record_cache('markdown', False)
+        result = _MARKDOWN[unit] = _render_markdown(unit)
+    else:
+        record_cache('markdown', True)
+    return result
+
+
+def _render_markdown(unit):
+    """Render markdown representation of a unit."""
     from operator import itemgetter
     if unit.is_Pow:
         item = unit.args
@@ -119,6 +140,7 @@ def markdown(unit):
         return str(unit)
 
 
+@instrumented('derive_unit')
 def derive_unit(expr, name=None):
     """Derive SI unit from an expression, omitting scale factors."""
     from essm.variables import Variable
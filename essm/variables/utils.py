@@ -20,10 +20,20 @@
 # MA 02111-1307, USA.
 """Utility function for variables, expressions and equations."""
 
-from essm.equations._core import BaseEquation, EquationMeta
+import functools
+import threading
+import weakref
+
+try:
+    from collections.abc import Sequence
+except ImportError:  # pragma: no cover
+    from collections import Sequence
+
+from essm.equations._core import BaseEquation, Equation, EquationMeta
 from essm.variables._core import BaseVariable
-from sympy import Eq, latex, preorder_traversal
+from sympy import Basic, Eq, latex
 from sympy.core.expr import Expr
+from sympy.utilities.iterables import iterable
 
 from .units import markdown
 
@@ -56,7 +66,96 @@ class ListTable(list):
         return ''.join(html)
 
 
-def generate_metadata_table(variables=None, include_header=True, cols=None):
+class LazyListTable(Sequence):
+    """Table rendering its rows on demand.
+
+    The rows are produced by calling ``render`` for the requested
+    ``items``.  In Jupyter notebooks only the first ``page_size`` rows
+    are rendered; further pages are available via :meth:`page`.
+    """
+
+    def __init__(self, header, items, render, page_size=100):
+        """Initialize table with an optional header row."""
+        self.header = header
+        self.items = list(items)
+        self.render = render
+        self.page_size = page_size
+
+    def __len__(self):
+        """Return number of rows including the header."""
+        return len(self.items) + (self.header is not None)
+
+    def __getitem__(self, index):
+        """Return rendered row or list of rows."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if self.header is not None:
+            if index == 0:
+                return self.header
+            index -= 1
+        return self.render(self.items[index])
+
+    def __eq__(self, other):
+        """Compare rendered rows."""
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        """Compare rendered rows."""
+        return not self == other
+
+    def page(self, number):
+        """Return ``ListTable`` with the header and one page of rows."""
+        table = ListTable()
+        if self.header is not None:
+            table.append(self.header)
+        start = number * self.page_size
+        table.extend(
+            self.render(item)
+            for item in self.items[start:start + self.page_size]
+        )
+        return table
+
+    def _repr_html_(self):
+        html = self.page(0)._repr_html_()
+        remaining = len(self.items) - self.page_size
+        if remaining > 0:
+            html += '<p>{0} more rows</p>'.format(remaining)
+        return html
+
+
+_METADATA_ROWS = weakref.WeakKeyDictionary()
+"""Rendered metadata rows with the definition they were rendered for."""
+
+
+def _metadata_row(variable):
+    """Return cached dictionary with rendered columns of a variable."""
+    from ._core import Variable
+    definition = variable.definition
+    cached = _METADATA_ROWS.get(variable)
+    if cached is not None and cached[0] is definition:
+        return cached[1]
+
+    defn1 = Variable.__expressions__.get(variable, '')
+    if len(str(defn1)) > 1:
+        defn = '$' + latex(defn1) + '$'
+    else:
+        defn = ''
+    row = {
+        'Symbol': '$' + definition.latex_name + '$',
+        'Name': str(variable),
+        'Description': variable.__doc__,
+        'Definition': defn,
+        'Default value': str(Variable.__defaults__.get(variable, '-')),
+        'Units': markdown(definition.unit),
+    }
+    _METADATA_ROWS[variable] = (definition, row)
+    return row
+
+
+def generate_metadata_table(variables=None, include_header=True, cols=None,
+                            lazy=False, incremental=False):
     """Generate table of variables, default values and units.
 
     If variables not provided in list ``variables``, table will contain
@@ -64,62 +163,87 @@ def generate_metadata_table(variables=None, include_header=True, cols=None):
     It is possible to remove columns by providing a tuple with a subste of:
     cols=('Symbol', 'Name', 'Description', 'Definition',
                 'Default value', 'Units')
+
+    Rendered rows are cached per variable until it is redefined.  If
+    ``lazy`` is true, a :class:`LazyListTable` rendering rows on demand is
+    returned.  If ``incremental`` is true, the table contains only
+    variables that were added or redefined since their rows were last
+    rendered.
     """
     from ._core import Variable
     all_cols = ('Symbol', 'Name', 'Description', 'Definition',
                 'Default value', 'Units')
     cols = cols or all_cols
-    table = ListTable()
     variables = variables or Variable.__registry__.keys()
+    if incremental:
+        variables = [
+            variable for variable in variables
+            if _METADATA_ROWS.get(variable, (None, ))[0] is not
+            variable.definition
+        ]
+    variables = sorted(variables,
+                       key=lambda x: x.definition.latex_name.lower())
+
+    def render(variable):
+        row = _metadata_row(variable)
+        return tuple(row[item] for item in cols)
+
+    header = tuple(cols) if include_header else None
+    if lazy:
+        return LazyListTable(header, variables, render)
+
+    table = ListTable()
     if include_header:
         table.append(cols)
-
-    for variable in sorted(variables,
-                           key=lambda x: x.definition.latex_name.lower()):
-        symbol = '$' + variable.definition.latex_name + '$'
-        name = str(variable)
-        doc = variable.__doc__
-        defn1 = Variable.__expressions__.get(variable, '')
-        if len(str(defn1)) > 1:
-            defn = '$' + latex(defn1) + '$'
-        else:
-            defn = ''
-        val = str(Variable.__defaults__.get(variable, '-'))
-        unit = markdown(variable.definition.unit)
-        dict_col = {}
-        dict_col['Symbol'] = symbol
-        dict_col['Name'] = name
-        dict_col['Description'] = doc
-        dict_col['Definition'] = defn
-        dict_col['Default value'] = val
-        dict_col['Units'] = unit
-
-        table.append(
-            tuple(dict_col[item] for item in cols)
-        )
+    table.extend(render(variable) for variable in variables)
     return table
 
 
+_VARIABLES = {}
+"""Extracted variables keyed by expression identity."""
+
+_VARIABLES_LOCK = threading.Lock()
+
+
+def _forget_variables(ref, key=None):
+    """Remove memoized variables of a garbage collected expression."""
+    entry = _VARIABLES.get(key)
+    if entry is not None and entry[0] is ref:
+        _VARIABLES.pop(key, None)
+
+
 def extract_variables(expr):
-    """Traverse through expression and return set of variables."""
-    return {
-        arg
-        for arg in preorder_traversal(expr) if isinstance(arg, BaseVariable)
-    }
+    """Return set of variables in expression.
+
+    The results are memoized for expression objects supporting weak
+    references, e.g. equations and variables, as long as they are alive.
+    Iterables of expressions, e.g. lists, are searched item by item.
+    """
+    if not isinstance(expr, Basic):
+        if iterable(expr):
+            return set().union(*map(extract_variables, expr))
+        return set()
+    key = id(expr)
+    with _VARIABLES_LOCK:
+        entry = _VARIABLES.get(key)
+    # Equal expressions can contain distinct variables, e.g. in scopes.
+    if entry is not None and entry[0]() is expr:
+        return set(entry[1])
+    variables = frozenset(expr.atoms(BaseVariable))
+    try:
+        ref = weakref.ref(expr, functools.partial(_forget_variables, key=key))
+    except TypeError:
+        return set(variables)
+    with _VARIABLES_LOCK:
+        _VARIABLES[key] = (ref, variables)
+    return set(variables)
 
 
 def get_allparents(equation, allparents=None):
     """Return set of parents of equation recursively."""
     if not allparents:
         allparents = set()
-    if isinstance(equation, BaseEquation):
-        parents = equation.definition.__bases__
-    else:
-        parents = equation.__bases__
-    for parent in parents:
-        if hasattr(parent, 'name'):
-            allparents.update([parent.name])
-            get_allparents(parent, allparents)
+    allparents.update(parent.name for parent in Equation.ancestors(equation))
     return allparents
 
 
@@ -133,6 +257,13 @@ def get_parents(equation):
     return allparents
 
 
+def get_descendants(equation):
+    """Return set of registered equations derived from equation."""
+    return {
+        descendant.name for descendant in Equation.descendants(equation)
+    }
+
+
 def replace_variables(expr, variables=None):
     """Replace all base variables in expression by ``variables``."""
     if not isinstance(expr, Expr)\
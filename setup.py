@@ -46,6 +46,8 @@ extras_require = {
         'nbsphinx>=0.6.1'
     ],
     'generator': ['yapf>=0.16.2', ],
+    'library': ['PyYAML>=3.12', 'toml>=0.10; python_version<"3.11"', ],
+    'numerics': ['numpy>=1.13', ],
     'tests':
         tests_require,
     'dev': [
@@ -200,10 +200,132 @@ def test_args():
     }
 
 
+def test_signature():
+    """Test input signature of equations."""
+    t = demo_fall.definition.t
+    signature = demo_fall.signature
+    assert signature is demo_fall.definition.signature
+    assert signature.lhs == demo_d
+    assert signature.inputs == (demo_g, t)
+    assert signature.internal == (t, )
+    assert signature.defaulted == (demo_g, )
+    assert signature.required == (t, )
+    assert signature.variables == (demo_d, demo_g, t)
+
+
 def test_variable_extraction():
     """Test extract variables from expression."""
     expr = demo_fall.rhs
     assert extract_variables(expr) == {demo_g, demo_fall.definition.t}
+    extract_variables(expr).clear()
+    assert extract_variables(expr) == {demo_g, demo_fall.definition.t}
+    assert extract_variables(Derivative(demo_d, demo_t)) == {demo_d, demo_t}
+    assert extract_variables(2.0) == set()
+    assert extract_variables([demo_d, (demo_t, 2.0)]) == {demo_d, demo_t}
+
+    # Memoized expressions are not kept alive.
+    import gc
+    import weakref
+    from essm.variables.utils import _VARIABLES
+    combined = demo_fall + demo_fall
+    variables = {demo_d, demo_g, demo_fall.definition.t}
+    assert extract_variables(combined) == variables
+    key, ref = id(combined), weakref.ref(combined)
+    assert key in _VARIABLES
+    del combined
+    gc.collect()
+    assert ref() is None
+    assert key not in _VARIABLES
+
+
+def test_define_many():
+    """Check bulk definition of equations from records."""
+    with Equation.scope():
+        eq_bulk, eq_bulk_child = Equation.define_many([
+            {'name': 'eq_bulk', 'expr': Eq(demo_v, demo_d / demo_t),
+             'doc': 'Bulk equation.'},
+            {'name': 'eq_bulk_child', 'parents': ['eq_bulk'],
+             'expr': 'Eq(demo_v, 2 * demo_d1 / demo_t)'},
+        ])
+        assert Equation.__registry__[eq_bulk] is eq_bulk.definition
+        assert eq_bulk.__doc__ == 'Bulk equation.'
+        assert eq_bulk.definition.__module__ == __name__
+        assert eq_bulk_child.rhs == 2 * demo_d1 / demo_t
+        assert Equation.ancestors(eq_bulk_child) == {eq_bulk.definition}
+        assert eq_bulk_child.signature.inputs == (demo_d1, demo_t)
+
+        with pytest.raises(ValueError):
+            Equation.define_many([
+                {'name': 'eq_bulk_ok', 'expr': Eq(demo_d, demo_v * demo_t)},
+                {'name': 'eq_bulk_bad', 'expr': Eq(demo_d, demo_v)},
+            ])
+        assert not [
+            definition for definition in Equation.__registry__.values()
+            if definition.name == 'eq_bulk_ok'
+        ]
+        with pytest.raises(ValueError):
+            Equation.define_many([
+                {'name': 'eq_bulk_typo', 'expr': 'Eq(demo_v, demo_d / typo)'},
+            ])
+
+        with pytest.warns(UserWarning) as record:
+            Equation.define_many([
+                {'name': 'eq_bulk', 'expr': Eq(demo_v, demo_d / demo_t)},
+            ])
+        assert len(record) == 1
+    assert eq_bulk not in Equation.__registry__
+
+
+def test_ancestry():
+    """Test ancestry index of equations."""
+    from essm.variables.utils import get_allparents, get_descendants
+
+    with Equation.scope():
+
+        class demo_eq_distance(Equation):
+            """Test equation."""
+
+            expr = Eq(demo_d, demo_v * demo_t)
+
+        class demo_eq_velocity(Equation):
+            """Test equation."""
+
+            expr = Eq(demo_v, demo_d / demo_t)
+
+        class demo_eq_both(demo_eq_distance.definition,
+                           demo_eq_velocity.definition):
+            """Test equation."""
+
+            expr = Eq(demo_d, demo_d1)
+
+        class demo_eq_child(demo_eq_both.definition):
+            """Test equation."""
+
+            expr = Eq(demo_t, demo_t1)
+
+        assert get_allparents(demo_eq_child) == {
+            'demo_eq_both', 'demo_eq_distance', 'demo_eq_velocity'
+        }
+        assert get_descendants(demo_eq_distance) == {
+            'demo_eq_both', 'demo_eq_child'
+        }
+        assert Equation.ancestors(demo_eq_both) == {
+            demo_eq_distance.definition, demo_eq_velocity.definition
+        }
+        assert Equation.descendants(demo_eq_child) == frozenset()
+
+        with Equation.scope():
+
+            class demo_descendant(demo_eq_velocity.definition):
+                expr = Eq(demo_d, demo_v * demo_t)
+
+            assert demo_descendant.definition in Equation.descendants(
+                demo_eq_velocity
+            )
+        assert demo_descendant.definition not in Equation.descendants(
+            demo_eq_velocity
+        )
+    assert not Equation.descendants(demo_eq_distance)
 
 
 def test_variable_replacement():
@@ -308,6 +430,63 @@ def test_double_registration():
     assert Equation.__registry__[demo_double].__doc__ == 'Second.'
 
 
+def test_pickle():
+    """Check that variables and equations are pickled by reference."""
+    import pickle
+    from essm.equations.leaf.energy_water import eq_Pwl
+
+    p_CC1 = eq_Pwl.definition.p_CC1
+    assert pickle.loads(pickle.dumps(eq_Pwl)).definition is eq_Pwl.definition
+    assert pickle.loads(pickle.dumps(p_CC1)).definition is p_CC1.definition
+    assert pickle.loads(pickle.dumps(eq_Pwl.rhs)) == eq_Pwl.rhs
+
+    class demo_local(Equation):
+        """Locally defined equation."""
+
+        expr = Eq(demo_d, demo_v * demo_t)
+
+    assert pickle.loads(pickle.dumps(demo_local)) is demo_local
+
+
+def test_preload(tmpdir, monkeypatch):
+    """Check preloading of libraries with cached unit validation."""
+    import essm
+    from essm.variables._core import VALIDATED_UNITS
+
+    monkeypatch.setenv('ESSM_CACHE_DIR', tmpdir.strpath)
+    timings = essm.preload()
+    assert list(timings) == list(essm._preload.LIBRARIES)
+    assert tmpdir.listdir(lambda path: path.basename.startswith(
+        'validated_units-'
+    ))
+
+    class demo_cached(Equation):
+        expr = Eq(demo_d, demo_v * demo_t)
+
+    hits = VALIDATED_UNITS.hits
+
+    class demo_cached(Equation):
+        expr = Eq(demo_d, demo_v * demo_t)
+
+    assert VALIDATED_UNITS.hits == hits + 1
+
+
+def test_validation_key_quantity():
+    """Check that keys of validated units include units of quantities."""
+    from sympy.physics.units import Quantity, length, time
+    from sympy.physics.units.systems.si import SI
+    from essm.variables._core import validation_key
+
+    demo_foo = Quantity('demo_foo')
+    SI.set_quantity_dimension(demo_foo, length)
+    key = validation_key(2 * demo_foo)
+    SI.set_quantity_scale_factor(demo_foo, 2)
+    assert validation_key(2 * demo_foo) != key
+    key = validation_key(2 * demo_foo)
+    SI.set_quantity_dimension(demo_foo, time)
+    assert validation_key(2 * demo_foo) != key
+
+
 def test_solve():
     """Check that equation solving works"""
 
@@ -317,6 +496,226 @@ def test_solve():
     ) == [0.031 * demo_d - 1.68e-7 * demo_d2]
 
 
+def test_solve_for(tmpdir, monkeypatch):
+    """Check that solved equations are registered and cached."""
+    import pickle
+    from essm.equations._core import _solve
+
+    monkeypatch.setenv('ESSM_CACHE_DIR', tmpdir.strpath)
+    with Equation.scope():
+        solved = demo_fall.solve_for(demo_g)
+        assert solved.lhs == demo_g
+        assert solved.rhs == 2 * demo_d / demo_fall.definition.t ** 2
+        assert issubclass(solved.definition, demo_fall.definition)
+        assert Equation.__registry__[solved] is solved.definition
+        assert demo_fall.solve_for(demo_g) is solved
+        assert demo_fall.solve_for(demo_d) is demo_fall
+        assert tmpdir.join('solutions').listdir()
+
+    # The source of a same-named class in this module must not be used.
+    with Equation.scope():
+        solved = demo_fall.solve_for(demo_g, name='demo_fall')
+        assert solved.rhs == 2 * demo_d / demo_fall.definition.t ** 2
+        assert solved.definition.__module__ == __name__
+
+    # Solutions are solved again when unpickled without the registry.
+    with Equation.scope():
+        data = pickle.dumps(demo_fall.solve_for(demo_g))
+    solved = pickle.loads(data)
+    assert solved.definition.__module__ == __name__
+    assert solved.definition.name == 'demo_fall_demo_g'
+    assert solved.rhs == 2 * demo_d / demo_fall.definition.t ** 2
+
+    assert tmpdir.join('solutions').stat().mode & 0o777 == 0o700
+    entry = tmpdir.join('solutions').listdir()[0]
+    assert 'BaseVariable' not in entry.read()
+    entry.write('Integer(42)')
+    assert _solve(demo_fall, demo_g) == 42
+
+    # Entries are not evaluated as code.
+    canary = tmpdir.join('canary')
+    canary.write('')
+    entry.write("__import__('os').remove({0!r})".format(canary.strpath))
+    assert _solve(demo_fall, demo_g) == solved.rhs
+    assert canary.check()
+    entry.write_binary(pickle.dumps(S(42)))
+    assert _solve(demo_fall, demo_g) != 42
+
+    with pytest.raises(ValueError):
+        demo_fall.solve_for(demo_fall.definition.t)
+
+
+def test_derive(tmpdir, monkeypatch):
+    """Check batch derivation of equations with cached results."""
+    from multiprocessing.pool import ThreadPool
+
+    from essm.derivation import derive, Step
+    from essm.equations.physics.thermodynamics import (eq_Pa, eq_PN2_PO2,
+                                                       eq_PO2, eq_rhoa,
+                                                       eq_rhoa_Pwa_Ta)
+    from essm.variables.physics.thermodynamics import P_N2, P_O2, rho_a
+
+    monkeypatch.setenv('ESSM_CACHE_DIR', tmpdir.strpath)
+    steps = [
+        Step('eq_rhoa', rho_a, [eq_rhoa_Pwa_Ta, 'eq_PN2', 'eq_PO2'],
+             eliminate=[P_N2, P_O2]),
+        Step('eq_PO2', P_O2, [eq_Pa, eq_PN2_PO2], eliminate=[P_N2]),
+        Step('eq_PN2', P_N2, [eq_Pa, eq_PN2_PO2], eliminate=[P_O2]),
+    ]
+    for processes in (2, 1):
+        with Equation.scope():
+            writer = EquationWriter(docstring='Derived.')
+            derived = derive(steps, processes=processes, writer=writer)
+            assert list(derived) == ['eq_PO2', 'eq_PN2', 'eq_rhoa']
+            assert (derived['eq_PO2'].rhs - eq_PO2.rhs).simplify() == 0
+            assert (derived['eq_rhoa'].rhs - eq_rhoa.rhs).simplify() == 0
+            assert issubclass(
+                derived['eq_rhoa'].definition, derived['eq_PO2'].definition
+            )
+            assert 'class eq_rhoa(eq_rhoa_Pwa_Ta.definition' in str(writer)
+            assert derived['eq_rhoa'].definition.__module__ == (
+                eq_rhoa_Pwa_Ta.definition.__module__
+            )
+    assert len(tmpdir.join('derivations').listdir()) == 3
+
+    # Workers receive plain symbols of variables defined after the pool.
+    monkeypatch.setenv('ESSM_CACHE_DIR', tmpdir.join('new').strpath)
+    with Variable.scope(), Equation.scope():
+
+        class demo_new_x(Variable):
+            """Scoped variable."""
+
+            unit = meter
+
+        class demo_new_y(Variable):
+            """Scoped variable."""
+
+            unit = meter
+
+        class demo_new_z(Variable):
+            """Scoped variable."""
+
+            unit = meter
+
+        class demo_eq_new(Equation):
+            """Scoped equation."""
+
+            expr = Eq(demo_new_x, demo_new_y + demo_new_z)
+
+        derived = derive([
+            Step('eq_new_y', demo_new_y, [demo_eq_new]),
+            Step('eq_new_z', demo_new_z, [demo_eq_new]),
+        ], processes=2, timeout=60)
+        assert derived['eq_new_y'].rhs == demo_new_x - demo_new_z
+        assert derived['eq_new_z'].rhs == demo_new_x - demo_new_y
+
+    monkeypatch.setenv('ESSM_CACHE_DIR', tmpdir.join('pool').strpath)
+    pool = ThreadPool(2)
+    with Equation.scope():
+        derived = derive(steps, pool=pool)
+        assert list(derived) == ['eq_PO2', 'eq_PN2', 'eq_rhoa']
+    assert pool.apply(len, (steps, )) == 3
+    pool.close()
+    pool.join()
+    assert len(tmpdir.join('pool', 'derivations').listdir()) == 3
+
+    with pytest.raises(ValueError):
+        derive([Step('eq_loop', P_O2, ['eq_loop'])])
+
+
+LIBRARY_TOML = """
+module = "demo_library"
+imports = ["essm.equations.leaf.energy_water"]
+
+[[variables]]
+name = "lib_d"
+unit = "meter"
+doc = "Distance."
+
+[[variables]]
+name = "lib_v"
+unit = "meter/second"
+default = 2
+
+[[variables]]
+name = "lib_t"
+unit = "second"
+expr = "lib_d / lib_v"
+
+[[equations]]
+name = "eq_lib_v"
+expr = "Eq(lib_v, lib_d / lib_t)"
+
+[[equations]]
+name = "eq_lib_d"
+doc = "Distance covered."
+expr = "Eq(lib_d, lib_v * lib_t)"
+parents = ["eq_lib_v", "essm.equations.leaf.energy_water:eq_Elmol"]
+"""
+
+
+def test_load_library(tmpdir, monkeypatch):
+    """Check definitions loaded from library files."""
+    import json
+
+    from essm.equations.leaf.energy_water import eq_Elmol
+    from essm.library import load_library, read_library
+
+    monkeypatch.setenv('ESSM_CACHE_DIR', tmpdir.mkdir('cache').strpath)
+    path = tmpdir.join('library.toml')
+    path.write(LIBRARY_TOML)
+    document = read_library(path.strpath)
+    cached, = tmpdir.join('cache', 'libraries').listdir()
+    assert json.loads(cached.read()) == document
+    assert read_library(path.strpath) == document
+    tmpdir.join('library.json').write(json.dumps(document))
+
+    for name in ('library.toml', 'library.json'):
+        with Variable.scope(), Equation.scope():
+            library = load_library(tmpdir.join(name).strpath)
+            lib_d, lib_v, lib_t = library.variables
+            eq_lib_v, eq_lib_d = library.equations
+            assert library.module == 'demo_library'
+            assert lib_d.__doc__ == 'Distance.'
+            assert Variable.__defaults__[lib_v] == 2
+            assert Variable.__units__[lib_v] == meter / second
+            assert Variable.__expressions__[lib_t] == lib_d / lib_v
+            assert eq_lib_d.rhs == lib_v * lib_t
+            assert eq_lib_d.definition.__module__ == 'demo_library'
+            assert Equation.ancestors(eq_lib_d) >= {
+                eq_lib_v.definition, eq_Elmol.definition
+            }
+        assert lib_d not in Variable.__registry__
+
+    with pytest.raises(ValueError):
+        load_library(tmpdir.join('library.txt').strpath)
+
+    tmpdir.join('demo_evil_module.py').write('raise SystemExit(1)\n')
+    monkeypatch.syspath_prepend(tmpdir.strpath)
+    for invalid in (
+            {'imports': ['os']},
+            {'variables': [{'name': 'lib_x', 'unit': 'meter.__class__'}]},
+            {'equations': [{
+                'name': 'eq_lib_x',
+                'expr': "Eq(lib_d, __import__('os').getpid())",
+            }]},
+            {'variables': [{'name': 'lib_x', 'expr': '2 * lib_typo'}]},
+            {'equations': [{'name': 'eq_lib_x'}]},
+            {'equations': [{
+                'name': 'eq_lib_x', 'expr': 'Eq(lib_d, lib_d)',
+                'parents': ['demo_evil_module:eq_x'],
+            }]},
+            {'equations': [{
+                'name': 'eq_lib_x', 'expr': 'Eq(lib_d, lib_d)',
+                'parents': ['essm.equations.leaf.energy_water:eq_missing'],
+            }]},
+            {'unknown': []},
+    ):
+        tmpdir.join('invalid.json').write(json.dumps(invalid))
+        with pytest.raises(ValueError):
+            load_library(tmpdir.join('invalid.json').strpath)
+
+
 def test_equation_writer(tmpdir):
     """EquationWriter creates importable file with internal variables."""
     from sympy import var
@@ -354,6 +753,55 @@ def test_equation_writer(tmpdir):
     assert g['eq_Pwl'].definition.expr == eq_Pwl.definition.expr
 
 
+def test_equation_writer_cache(tmpdir):
+    """EquationWriter caches output and lints deferred output on write."""
+    from essm.equations.physics.thermodynamics import eq_Pa, eq_PN2_PO2
+
+    linted = EquationWriter(docstring='Test.')
+    deferred = EquationWriter(docstring='Test.', lint='deferred')
+    for writer in (linted, deferred):
+        writer.eq(eq_Pa)
+        assert str(writer) is str(writer)
+    assert str(deferred) != str(linted)
+
+    for writer in (linted, deferred):
+        writer.eq(eq_PN2_PO2)
+    assert 'eq_PN2_PO2' in str(linted)
+    assert 'eq_PN2_PO2' in str(deferred)
+    eq_file = tmpdir.join('test_equations.py')
+    deferred.write(eq_file.strpath)
+    assert eq_file.read() == str(linted)
+
+    with pytest.raises(ValueError):
+        EquationWriter(lint='later')
+
+
+def test_equation_writer_stream(tmpdir):
+    """EquationWriter streams entries and writes the header on close."""
+    from essm.equations.physics.thermodynamics import eq_Pa, eq_PN2_PO2
+
+    for lint in (True, False):
+        writer = EquationWriter(docstring='Test.', lint=lint)
+        stream = tmpdir.join('stream_{0}.py'.format(lint))
+        with EquationWriter(docstring='Test.', lint=lint,
+                            stream=stream.strpath) as streaming:
+            for eq in (eq_Pa, eq_PN2_PO2):
+                writer.eq(eq)
+                streaming.eq(eq)
+            assert streaming.eqs == []
+            assert not stream.check()
+            with pytest.raises(ValueError):
+                str(streaming)
+        assert stream.read() == str(writer)
+    assert len(tmpdir.listdir()) == 2
+
+    with pytest.raises(KeyError):
+        with EquationWriter(stream=tmpdir.join('error.py').strpath) as error:
+            error.eq(eq_Pa)
+            raise KeyError()
+    assert len(tmpdir.listdir()) == 2
+
+
 def test_equation_writer_linebreaks(tmpdir):
     """EquationWriter breaks long import lines."""
     from essm.variables.physics.thermodynamics import alpha_a, D_va, P_wa, \
@@ -429,3 +877,77 @@ def test_equation_variable_writer_imports(tmpdir):
         code = compile(eq_file.read(), eq_file, "exec")
     exec(code, g)
     assert g['eq_sin_energy'].definition.expr == eq_sin_energy.definition.expr
+
+
+def test_collect_imports():
+    """Classify objects to import in a single traversal."""
+    from essm._generator import collect_imports
+    from sympy.physics.units import joule
+
+    expr = Eq(demo_d, sqrt(demo_d1 * demo_d) * cos(demo_t / demo_t1) / joule)
+    imports = collect_imports(expr)
+    assert imports.functions == {cos}
+    assert imports.units == {joule}
+    assert imports.variables == {demo_d, demo_d1, demo_t, demo_t1}
+    assert imports.constants == {'Eq', 'sqrt'}
+    assert collect_imports(expr) is imports
+    assert collect_imports(1 / sqrt(demo_d)).constants == {'sqrt'}
+
+
+def test_combined_equation():
+    """Check that combined equations are transient."""
+    import gc
+    import pickle
+    from essm.equations import CombinedEquation
+    from essm.equations.physics.thermodynamics import eq_Pa, eq_PN2_PO2
+
+    size = len(Equation.__registry__)
+    combined = eq_Pa + eq_PN2_PO2 + eq_Pa
+    for _ in range(10):
+        eq_Pa + eq_PN2_PO2 + eq_Pa
+    gc.collect()
+    assert isinstance(combined, CombinedEquation)
+    assert combined.parents == (eq_Pa, eq_PN2_PO2, eq_Pa)
+    assert list(Equation.__transient__.values()) == [combined]
+    assert len(Equation.__registry__) == size
+    assert combined.unit == derive_baseunit(eq_Pa.lhs)
+
+    unpickled = pickle.loads(pickle.dumps(combined))
+    assert unpickled == combined
+    assert unpickled.parents == combined.parents
+    del unpickled
+
+    with Equation.scope():
+        registered = combined.register()
+        assert registered.definition.__bases__ == (
+            eq_Pa.definition, eq_PN2_PO2.definition
+        )
+        assert len(Equation.__registry__) == size + 1
+    assert not Equation.__transient__
+
+    with pytest.raises(ValueError):
+        eq_Pa + demo_fall
+
+
+def test_combined_equation_api():
+    """Check that combined equations behave like registered ones."""
+    from essm.equations.physics.thermodynamics import (eq_Pa, eq_PN2_PO2,
+                                                       eq_PO2)
+    from essm.variables.physics.thermodynamics import P_O2
+
+    combined = eq_Pa + eq_PN2_PO2
+    substituted = combined.subs(eq_PO2)
+    assert substituted.lhs == eq_Pa.lhs + eq_PN2_PO2.lhs
+    assert substituted.rhs == (eq_Pa.rhs + eq_PN2_PO2.rhs).subs(
+        eq_PO2.lhs, eq_PO2.rhs
+    )
+    assert combined.subs(P_O2, 1).rhs == (
+        eq_Pa.rhs + eq_PN2_PO2.rhs
+    ).subs(P_O2, 1)
+    assert combined.subs({P_O2: 1}) == combined.subs(P_O2, 1)
+    assert combined.definition.__bases__ == (
+        eq_Pa.definition, eq_PN2_PO2.definition
+    )
+    assert combined.__doc__ == 'Sum of eq_Pa, eq_PN2_PO2.'
+    assert combined.signature.lhs == combined.lhs
+    assert combined.definition not in Equation.__registry__.values()
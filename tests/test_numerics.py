@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""Test numerical evaluation of equations."""
+
+import pytest
+from sympy import Derivative
+
+from essm import Eq
+from essm.equations import Equation
+from essm.variables import Variable
+from essm.variables.units import meter, second
+
+np = pytest.importorskip('numpy')
+
+
+class demo_x(Variable):
+    """Test variable."""
+
+    unit = meter
+
+
+class demo_t(Variable):
+    """Test variable."""
+
+    unit = second
+    default = 2
+
+
+class demo_u(Variable):
+    """Test variable."""
+
+    unit = meter / second
+
+
+class demo_a(Variable):
+    """Test variable."""
+
+    unit = meter / second ** 2
+
+
+class demo_eq_u(Equation):
+    """Test equation."""
+
+    expr = Eq(demo_u, demo_x / demo_t)
+
+
+class demo_eq_a(Equation):
+    """Test equation."""
+
+    expr = Eq(demo_a, demo_u / demo_t)
+
+
+@pytest.fixture(autouse=True)
+def cache(tmpdir, monkeypatch):
+    """Use temporary cache directory."""
+    monkeypatch.setenv('ESSM_CACHE_DIR', tmpdir.strpath)
+
+
+def test_compile_equations():
+    """Check that both backends evaluate equations in order."""
+    from essm.equations.physics.thermodynamics import eq_Nu_forced_all
+    from essm.numerics import compile_equations
+
+    kernel = compile_equations([demo_eq_u, demo_eq_a])
+    assert kernel.inputs == (demo_x, )
+    assert kernel.outputs == (demo_u, demo_a)
+    u, a = kernel(demo_x=np.array([[1.0, 2.0], [3.0, 4.0]]))
+    assert np.allclose(u, [[0.5, 1.0], [1.5, 2.0]])
+    assert np.allclose(a, u / 2)
+
+    kernel = compile_equations([demo_eq_u], inputs=[demo_x, demo_t])
+    assert np.allclose(kernel([1.0, 2.0], 4.0)[0], [0.25, 0.5])
+
+    re = np.linspace(1e3, 1e5, 1000)
+    c_kernel = compile_equations([eq_Nu_forced_all])
+    numpy_kernel = compile_equations([eq_Nu_forced_all], backend='numpy')
+    assert numpy_kernel.backend == 'numpy'
+    assert np.allclose(
+        c_kernel(Pr=0.71, Re=re, Re_c=3000.0)[0],
+        numpy_kernel(Pr=0.71, Re=re, Re_c=3000.0)[0],
+    )
+
+
+def test_compile_equations_fallback(monkeypatch):
+    """Check NumPy fallback without C compiler."""
+    from essm.numerics import compile_equations
+
+    monkeypatch.setenv('CC', 'essm-missing-compiler')
+    kernel = compile_equations([demo_eq_u])
+    assert kernel.backend == 'numpy'
+    assert np.allclose(kernel(demo_x=3.0)[0], 1.5)
+
+    with pytest.raises(OSError):
+        compile_equations([demo_eq_u], backend='c')
+
+
+def test_compile_flags(monkeypatch):
+    """Check that fast math must be enabled explicitly."""
+    import subprocess
+
+    from essm.numerics import compile_equations
+
+    commands = []
+
+    def check_output(command, **kwargs):
+        commands.append(command)
+        raise OSError('not compiled')
+
+    monkeypatch.setattr(subprocess, 'check_output', check_output)
+    monkeypatch.delenv('CFLAGS', raising=False)
+    monkeypatch.delenv('ESSM_CFLAGS', raising=False)
+    with pytest.raises(OSError):
+        compile_equations([demo_eq_u], backend='c')
+    assert commands[-1][1:] == ['-O2', '-fPIC', '-c', 'kernel.c']
+
+    monkeypatch.setenv('CFLAGS', '-O1')
+    monkeypatch.setenv('ESSM_CFLAGS', '-O3 -ffast-math')
+    with pytest.raises(OSError):
+        compile_equations([demo_eq_u], backend='c')
+    assert commands[-1][1:3] == ['-O3', '-ffast-math']
+
+
+def test_compile_equations_order():
+    """Check that results must be computed before they are used."""
+    from essm.numerics import compile_equations
+
+    with pytest.raises(ValueError):
+        compile_equations([demo_eq_a, demo_eq_u], inputs=[demo_x])
+
+
+def test_compile_gradient():
+    """Check symbolic gradients and their units."""
+    from essm.numerics import compile_gradient
+
+    kernel = compile_gradient(demo_eq_u, [demo_x, demo_t])
+    assert kernel.inputs == (demo_t, demo_x)
+    assert kernel.units == (1 / second, meter / second ** 2)
+    value, gradient = kernel(demo_x=[1.0, 2.0], demo_t=4.0)
+    assert np.allclose(value, [0.25, 0.5])
+    assert gradient.shape == (2, 2)
+    assert np.allclose(gradient[0], 0.25)
+    assert np.allclose(gradient[1], [-1.0 / 16, -2.0 / 16])
+
+    numpy_kernel = compile_gradient(demo_eq_u, [demo_x], backend='numpy')
+    assert numpy_kernel.inputs == (demo_x, )
+    assert np.allclose(numpy_kernel(3.0)[1], 0.5)
+
+
+def test_propagate_uncertainty():
+    """Check that linear and Monte Carlo propagation agree."""
+    from essm.numerics import propagate_uncertainty
+
+    values = {demo_x: [1.0, 2.0], 'demo_t': 4.0}
+    uncertainties = {demo_x: 0.1, demo_t: [0.0, 0.2]}
+    mean, std = propagate_uncertainty(demo_eq_u, values, uncertainties)
+    assert np.allclose(mean, [0.25, 0.5])
+    assert np.allclose(std, [0.025, np.hypot(0.025, 0.5 * 0.2 / 4)])
+
+    mc_mean, mc_std = propagate_uncertainty(
+        demo_eq_u, values, uncertainties, method='montecarlo',
+        samples=20000, chunk_size=30000, seed=42
+    )
+    assert mc_mean.shape == (2, )
+    assert np.allclose(mc_mean, mean, rtol=0.02)
+    assert np.allclose(mc_std, std, rtol=0.05)
+
+    for method in ('taylor', 'montecarlo'):
+        mean, std = propagate_uncertainty(
+            demo_eq_u, values, {}, method=method
+        )
+        assert np.allclose(mean, [0.25, 0.5])
+        assert std.shape == (2, ) and not std.any()
+        mean, std = propagate_uncertainty(
+            demo_eq_u, {demo_x: 3.0}, {}, method=method
+        )
+        assert mean.shape == std.shape == ()
+        assert np.allclose(mean, 1.5) and std == 0
+
+    with pytest.raises(KeyError):
+        propagate_uncertainty(demo_eq_u, {demo_x: 1.0}, {demo_a: 1.0})
+    with pytest.raises(ValueError):
+        propagate_uncertainty(demo_eq_u, values, {}, method='unknown')
+
+
+class demo_k(Variable):
+    """Test variable."""
+
+    unit = 1 / second
+
+
+class demo_eq_decay(Equation):
+    """Test equation."""
+
+    expr = Eq(Derivative(demo_x, demo_t), -demo_k * demo_x)
+
+
+def test_ode_system():
+    """Check integration of many scenarios at once."""
+    from essm.numerics import ODESystem
+
+    system = ODESystem([demo_eq_decay], demo_t)
+    assert system.states == (demo_x, )
+    assert system.parameters == (demo_k, )
+    times = np.linspace(0, 2, 5)
+    rates = [0.5, 1.0, 2.0]
+    states = system.integrate({demo_x: 1.0}, times, {'demo_k': rates},
+                              substeps=10)
+    assert states.shape == (5, 1, 3)
+    assert np.allclose(
+        states[:, 0], np.exp(-np.outer(times, rates)), rtol=1e-5
+    )
+
+    auxiliary = ODESystem([demo_eq_u, Eq(Derivative(demo_x, demo_t), demo_u)],
+                          demo_t, backend='numpy')
+    assert auxiliary.parameters == ()
+    assert np.allclose(
+        auxiliary.integrate({demo_x: 1.0}, [1.0, 2.0])[:, 0], [1.0, 2.0]
+    )
+
+    with pytest.raises(ValueError):
+        ODESystem([demo_eq_u], demo_t)
+    with pytest.raises(ValueError):
+        ODESystem([Eq(Derivative(demo_x, demo_t), demo_k)], demo_t)
+    with pytest.raises(KeyError):
+        system.integrate({demo_x: 1.0}, times)
+    with pytest.raises(ValueError):
+        system.integrate({demo_x: 1.0}, [], {'demo_k': rates})
@@ -150,6 +150,284 @@ def test_remove_variable_from_registry():
         del Variable[removable]
 
 
+def test_registry_scope():
+    """Check that scoped definitions are private to the current thread."""
+    import threading
+
+    from essm.equations import Equation
+
+    seen = {}
+
+    def lookup():
+        seen['other'] = scoped in Variable.__registry__
+
+    with Variable.scope():
+
+        class scoped(Variable):
+            """Scoped variable."""
+
+            unit = meter
+            default = 3
+
+        assert Variable.__registry__[scoped] is scoped.definition
+        assert Variable.__defaults__[scoped] == 3
+        assert scoped in list(Variable.__registry__)
+        thread = threading.Thread(target=lookup)
+        thread.start()
+        thread.join()
+
+    assert seen == {'other': False}
+    assert scoped not in Variable.__registry__
+    assert scoped not in Variable.__defaults__
+    assert demo_variable in Variable.__registry__
+
+    with Equation.scope():
+
+        class demo_scoped_eq(Equation):
+            """Scoped equation with an internal variable."""
+
+            class demo_scoped_d(Variable):
+                """Internal variable."""
+
+                unit = meter
+
+            expr = Eq(demo_scoped_d, 2 * demo_variable)
+
+        internal = demo_scoped_eq.definition.demo_scoped_d
+        assert internal in Variable.__registry__
+    assert internal not in Variable.__registry__
+    assert not Variable.find(name='demo_scoped_d')
+
+    # The symbol shared with other threads keeps its definition.
+    from essm.variables.physics.thermodynamics import T_a as shared
+
+    permanent = shared.definition
+    with Variable.scope():
+        with pytest.warns(UserWarning):
+
+            class T_a(Variable):
+                """Scoped air temperature."""
+
+                unit = second
+
+        assert Variable.__registry__[shared] is T_a.definition
+        assert Variable.__units__[shared] == second
+        thread = threading.Thread(
+            target=lambda: seen.update(other=shared.definition)
+        )
+        thread.start()
+        thread.join()
+        assert seen['other'] is permanent
+    assert shared.definition is permanent
+    assert shared.definition.unit != second
+    assert Variable.__registry__[shared] is permanent
+
+
+def test_registry_transient():
+    """Check that transient definitions are reclaimed and evicted."""
+    import gc
+
+    from essm.equations import Equation
+    from sympy.core.cache import clear_cache
+
+    sizes = Variable.sizes()
+    with Variable.transient() as generation:
+
+        class transient(Variable):
+            """Transient variable."""
+
+            unit = meter
+            default = 3
+
+    assert Variable.__registry__[transient] is transient.definition
+    assert Variable.__defaults__[transient] == 3
+    assert transient in list(Variable.__registry__)
+    assert not Variable.find(name='transient')
+    assert Variable.sizes()['__registry__'] == (
+        sizes['__registry__'].permanent, sizes['__registry__'].transient + 1
+    )
+
+    del transient
+    clear_cache()  # SymPy caches created symbols
+    gc.collect()
+    assert Variable.sizes() == sizes
+
+    with Variable.transient() as next_generation:
+
+        class evicted(Variable):
+            """Evicted variable."""
+
+            unit = meter
+
+    assert next_generation > generation
+    assert Variable.evict(generation) == 0
+    assert Variable.evict(next_generation) == 1
+    assert evicted not in Variable.__registry__
+    assert evicted not in Variable.__units__
+    assert Variable.sizes() == sizes
+
+    class demo_shadowed(Variable):
+        """Permanent variable."""
+
+        unit = meter
+
+    shared, permanent = demo_shadowed, demo_shadowed.definition
+    with Variable.transient() as generation:
+        assert Variable.__units__.generation == generation
+        assert Equation.__registry__.generation is None
+        with pytest.warns(UserWarning):
+
+            class demo_shadowed(Variable):
+                """Transient variable."""
+
+                unit = second
+
+    assert Variable.__registry__[demo_shadowed] is not permanent
+    assert Variable.__units__[demo_shadowed] == second
+    assert Variable.find(name='demo_shadowed') == {demo_shadowed}
+    assert list(Variable.__registry__).count(demo_shadowed) == 1
+    assert shared.definition is permanent
+    assert Variable.evict(generation) == 1
+    assert Variable.__registry__[demo_shadowed] is permanent
+    assert Variable.__units__[demo_shadowed] == meter
+    assert shared.definition is permanent
+    Variable.check_unit(shared + meter)
+    with pytest.warns(UserWarning):
+        del Variable[demo_shadowed]
+    assert not Variable.find(name='demo_shadowed')
+    assert Variable.sizes() == sizes
+
+
+def test_define_many():
+    """Check bulk definition of variables from records."""
+    with Variable.scope():
+        bulk_d, bulk_v = Variable.define_many([
+            {'name': 'bulk_d', 'unit': meter, 'default': 2,
+             'latex_name': 'd_b', 'doc': 'Distance.'},
+            {'name': 'bulk_v', 'unit': meter, 'expr': 'bulk_d / 4'},
+        ])
+        assert Variable.__registry__[bulk_d] is bulk_d.definition
+        assert bulk_d.definition.__module__ == __name__
+        assert bulk_d.__doc__ == 'Distance.'
+        assert bulk_d.definition.latex_name == 'd_b'
+        assert Variable.__defaults__[bulk_d] == 2
+        assert Variable.__units__[bulk_v] == meter
+        assert Variable.__expressions__[bulk_v] == bulk_d / 4
+        assert Variable.find(name='bulk_v') == {bulk_v}
+
+        with pytest.raises(ValueError):
+            Variable.define_many([
+                {'name': 'bulk_t', 'unit': second},
+                {'name': 'bulk_l', 'unit': meter, 'expr': 2 * bulk_d ** 2},
+            ])
+        assert not Variable.find(name='bulk_t')
+        with pytest.raises(ValueError):
+            Variable.define_many([
+                {'name': 'bulk_t', 'unit': meter, 'expr': 'bulk_d.func'},
+            ])
+
+        with pytest.warns(UserWarning) as record:
+            Variable.define_many([
+                {'name': 'bulk_d', 'unit': meter},
+                {'name': 'bulk_v', 'unit': meter / second},
+            ])
+        assert len(record) == 1
+        assert '2 definitions' in str(record[0].message)
+
+        # A failing batch leaves existing variables unchanged.
+        definition = Variable.__registry__[bulk_d]
+        with pytest.raises(ValueError):
+            Variable.define_many([
+                {'name': 'bulk_d', 'unit': second, 'doc': 'Replacement.'},
+                {'name': 'bulk_a', 'unit': meter, 'expr': 'bulk_d * bulk_d'},
+            ])
+        assert Variable.__registry__[bulk_d] is definition
+        assert Variable.__units__[bulk_d] == meter
+        assert bulk_d.definition.unit == meter
+        assert definition.__doc__ != 'Replacement.'
+    assert bulk_d not in Variable.__registry__
+
+
+def test_module_parsed_once(tmpdir, monkeypatch):
+    """Check that a module with many definitions is parsed only once."""
+    import ast
+    import importlib
+    import sys
+
+    lines = ['from essm.variables import Variable',
+             'from essm.variables.units import meter']
+    for i in range(20):
+        lines += ['', '', 'class demo_chain{0}(Variable):'.format(i),
+                  '    """Generated variable."""', '', '    unit = meter']
+        if i:
+            lines.append('    expr = 2 * demo_chain{0}'.format(i - 1))
+    tmpdir.join('demo_generated.py').write('\n'.join(lines) + '\n')
+    monkeypatch.syspath_prepend(tmpdir.strpath)
+
+    calls = []
+    parse = ast.parse
+
+    def counting_parse(*args, **kwargs):
+        calls.append(args)
+        return parse(*args, **kwargs)
+
+    monkeypatch.setattr(ast, 'parse', counting_parse)
+    try:
+        with Variable.scope():
+            module = importlib.import_module('demo_generated')
+            assert Variable.__expressions__[module.demo_chain19] == (
+                2 * module.demo_chain18
+            )
+    finally:
+        sys.modules.pop('demo_generated', None)
+    assert len(calls) == 1
+
+
+def test_find():
+    """Check lookup of variables by name, dimension and module."""
+    from sympy.physics.units import length
+
+    assert Variable.find(name='demo_variable') == {demo_variable}
+    assert {demo_variable, demo_variable1} <= Variable.find(
+        dimension=length, module=__name__
+    )
+    assert Variable.find(dimension=meter) == Variable.find(dimension=length)
+    assert E_l in Variable.find(dimension=E_l)
+
+    class indexed(Variable):
+        """Removable variable."""
+
+        unit = second
+
+    assert indexed in Variable.find(dimension=second, module=__name__)
+    with pytest.warns(UserWarning):
+        del Variable[indexed]
+    assert not Variable.find(name='indexed')
+
+
+def test_instrument():
+    """Check recording of hot path statistics."""
+    import json
+
+    import essm
+
+    with essm.instrument() as recorder:
+
+        class instrumented(Variable):
+            """Instrumented variable."""
+
+            expr = 2 * demo_variable
+
+    owner = __name__ + ':instrumented'
+    assert recorder.calls['define', owner] == 1
+    assert recorder.calls['build_instance_expression', owner] == 1
+    assert recorder.calls['check_unit', owner] > 0
+    assert recorder.calls['derive_unit', owner] == 1
+    report = json.loads(recorder.to_json())
+    assert report['totals']['derive_unit']['calls'] == 1
+    assert recorder.table()[0][0] == 'hook'
+
+
 def test_latex():
     """Test latex representaiton of variables."""
 
@@ -169,6 +447,23 @@ def test_markdown():
     assert markdown(second / meter) == 's m$^{-1}$'
 
 
+def test_markdown_cache():
+    """Check that units are rendered when variables are defined."""
+    from essm.variables.units import _MARKDOWN
+
+    unit = kilogram ** 3 / second ** 5
+    assert unit not in _MARKDOWN
+    with Variable.scope():
+
+        class demo_markdown(Variable):
+            """Test variable."""
+
+            unit = kilogram ** 3 / second ** 5
+
+    assert _MARKDOWN[unit] == 'kg$^{3}$ s$^{-5}$'
+    assert markdown(unit) is _MARKDOWN[unit]
+
+
 def test_generate_metadata_table():
     """Check display of table of units."""
     assert generate_metadata_table([demo_expression_variable, E_l, lambda_E]) \
@@ -182,6 +477,53 @@ def test_generate_metadata_table():
             'Latent heat flux from leaf.', '', '-', 'J s$^{-1}$ m$^{-2}$')]
 
 
+def test_generate_metadata_table_cache():
+    """Check cached, lazy and incremental metadata tables."""
+    from essm.variables.utils import LazyListTable
+
+    with Variable.scope():
+
+        class demo_table_c(Variable):
+            """Test variable."""
+
+            unit = second
+
+        class demo_table_a(Variable):
+            """Test variable."""
+
+            unit = meter
+
+        class demo_table_b(Variable):
+            """Test variable."""
+
+            unit = kilogram
+
+        variables = [demo_table_c, demo_table_a, demo_table_b]
+        table = generate_metadata_table(variables, cols=('Name', 'Units'))
+        lazy = generate_metadata_table(variables, cols=('Name', 'Units'),
+                                       lazy=True)
+        assert isinstance(lazy, LazyListTable)
+        assert lazy == table
+        assert lazy[-1] == ('demo_table_c', 's')
+        lazy.page_size = 2
+        assert lazy.page(1) == [('Name', 'Units'), table[-1]]
+        assert '1 more rows' in lazy._repr_html_()
+
+        assert generate_metadata_table(
+            variables, include_header=False, incremental=True
+        ) == []
+
+        class demo_incremental(Variable):
+            """Test variable."""
+
+            unit = meter
+
+        assert generate_metadata_table(
+            variables + [demo_incremental], cols=('Name', ),
+            incremental=True
+        ) == [('Name', ), ('demo_incremental', )]
+
+
 def test_variable_writer(tmpdir):
     """VariableWriter creates importable file with variable definitions."""
     from essm.variables.physics.thermodynamics import c_pa